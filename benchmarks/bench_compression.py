@@ -0,0 +1,150 @@
+"""
+Compare size and CPU cost of bronze compression codecs.
+
+Payloads mimic the four bronze shapes we store (WHO records, Eurostat JSON-stat,
+ECDC national records and an OpenAQ hourly page), generated locally so the
+benchmark needs no network access.
+
+Usage (from repository root):
+    python -m benchmarks.bench_compression
+"""
+import json
+import random
+import time
+
+from ingestion import s3_utils
+from ingestion.download_openaq import EU27_COUNTRIES as EU27_ISO2
+from ingestion.download_who import EU27_COUNTRIES as EU27_ISO3
+
+ROUNDS = 5
+CASES = [("none", None)] + [("gzip", lvl) for lvl in (1, 6, 9)] + [("zstd", lvl) for lvl in (1, 3, 9, 19)]
+
+
+def who_payload():
+    """WHO GHO indicator filtered to EU27, yearly records."""
+    rng = random.Random(1)
+    records = [
+        {
+            "Id": rng.randint(10**6, 10**7),
+            "IndicatorCode": "AIR_42",
+            "SpatialDimType": "COUNTRY",
+            "SpatialDim": iso3,
+            "TimeDimType": "YEAR",
+            "TimeDim": year,
+            "Dim1Type": "SEX",
+            "Dim1": sex,
+            "Value": f"{rng.uniform(5, 80):.1f} [{rng.uniform(1, 5):.1f}-{rng.uniform(80, 120):.1f}]",
+            "NumericValue": round(rng.uniform(5, 80), 5),
+            "Low": round(rng.uniform(1, 5), 5),
+            "High": round(rng.uniform(80, 120), 5),
+            "Date": "2022-08-19T10:20:53.61+02:00",
+        }
+        for iso3 in EU27_ISO3
+        for year in range(2000, 2020)
+        for sex in ("SEX_MLE", "SEX_FMLE", "SEX_BTSX")
+    ]
+    return {"indicator": "AIR_42", "records": records}
+
+
+def eurostat_payload():
+    """Eurostat JSON-stat dataset with a flat value dict."""
+    rng = random.Random(2)
+    years = [str(y) for y in range(2000, 2024)]
+    geo = ["EU27_2020"] + EU27_ISO2
+    units = ["RT", "NR"]
+    n = len(units) * len(geo) * len(years)
+    return {
+        "version": "2.0",
+        "class": "dataset",
+        "label": "Deaths from respiratory diseases",
+        "id": ["unit", "geo", "time"],
+        "size": [len(units), len(geo), len(years)],
+        "value": {str(i): round(rng.uniform(0, 500), 1) for i in range(n) if rng.random() > 0.1},
+        "status": {str(i): "p" for i in range(0, n, 17)},
+        "dimension": {
+            "unit": {"category": {"index": {u: i for i, u in enumerate(units)}}},
+            "geo": {"category": {"index": {g: i for i, g in enumerate(geo)}}},
+            "time": {"category": {"index": {y: i for i, y in enumerate(years)}}},
+        },
+    }
+
+
+def ecdc_payload():
+    """ECDC nationalcasedeath: one record per country/indicator/week."""
+    rng = random.Random(3)
+    return [
+        {
+            "country": f"Country {iso}",
+            "country_code": iso,
+            "continent": "Europe",
+            "population": rng.randint(400_000, 83_000_000),
+            "indicator": indicator,
+            "weekly_count": rng.randint(0, 100_000),
+            "year_week": f"{year}-{week:02d}",
+            "rate_14_day": round(rng.uniform(0, 2000), 6),
+            "cumulative_count": rng.randint(0, 10_000_000),
+            "source": "Epidemic intelligence, national weekly data",
+        }
+        for iso in EU27_ISO2
+        for indicator in ("cases", "deaths")
+        for year in (2020, 2021, 2022, 2023)
+        for week in range(1, 53)
+    ]
+
+
+def openaq_payload():
+    """One OpenAQ v3 /measurements/hourly page (1000 results)."""
+    rng = random.Random(4)
+    results = []
+    for h in range(1000):
+        day, hour = divmod(h, 24)
+        ts = f"2024-01-{day % 28 + 1:02d}T{hour:02d}:00:00Z"
+        results.append({
+            "value": round(rng.uniform(2, 60), 2),
+            "flagInfo": {"hasFlags": False},
+            "parameter": {"id": 2, "name": "pm25", "units": "µg/m³", "displayName": None},
+            "period": {
+                "label": "1hour",
+                "interval": "01:00:00",
+                "datetimeFrom": {"utc": ts, "local": ts.replace("Z", "+01:00")},
+                "datetimeTo": {"utc": ts, "local": ts.replace("Z", "+01:00")},
+            },
+            "coordinates": None,
+            "summary": None,
+            "coverage": {
+                "expectedCount": 1, "expectedInterval": "01:00:00",
+                "observedCount": 1, "observedInterval": "01:00:00",
+                "percentComplete": 100.0, "percentCoverage": 100.0,
+                "datetimeFrom": {"utc": ts, "local": ts}, "datetimeTo": {"utc": ts, "local": ts},
+            },
+        })
+    return {"meta": {"name": "openaq-api", "page": 1, "limit": 1000, "found": 17000}, "results": results}
+
+
+def bench(name, obj):
+    """Print size ratio and per-call CPU time for every codec/level."""
+    raw = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    print(f"\n{name}: {len(raw) / 1024:.1f} KiB uncompressed")
+    print(f"{'codec':<6} {'level':>5} {'KiB':>9} {'ratio':>7} {'compress ms':>12} {'decompress ms':>14}")
+    for codec, level in CASES:
+        if codec == "zstd" and s3_utils.zstandard is None:
+            continue
+        start = time.process_time()
+        for _ in range(ROUNDS):
+            body, _, _, used = s3_utils.compress_bytes(raw, codec, level)
+        c_ms = (time.process_time() - start) / ROUNDS * 1000
+        start = time.process_time()
+        for _ in range(ROUNDS):
+            s3_utils.decompress_bytes(body, codec)
+        d_ms = (time.process_time() - start) / ROUNDS * 1000
+        print(f"{codec:<6} {str(used):>5} {len(body) / 1024:>9.1f} {len(raw) / len(body):>7.1f} "
+              f"{c_ms:>12.2f} {d_ms:>14.2f}")
+
+
+if __name__ == "__main__":
+    if s3_utils.zstandard is None:
+        print("zstandard not installed: skipping zstd rows (pip install zstandard)")
+    bench("WHO indicator", who_payload())
+    bench("Eurostat dataset", eurostat_payload())
+    bench("ECDC national", ecdc_payload())
+    bench("OpenAQ hourly page", openaq_payload())
@@ -1,12 +1,33 @@
 import os
 import json
+import codecs
+import tempfile
 import boto3
 import requests
 from botocore.exceptions import ClientError
 
+try:
+    from ingestion.s3_utils import put_bytes
+    from ingestion.profiling import run_with_profiling, checkpoint
+    from ingestion.ledger import flush_ledger, reset_ledger
+except ImportError:  # flat Lambda package: helpers sit next to this module
+    from s3_utils import put_bytes
+    from profiling import run_with_profiling, checkpoint
+    from ledger import flush_ledger, reset_ledger
+
 # ECDC national cases & deaths dataset (country-level, JSON)
 ECDC_COVID_URL = "https://opendata.ecdc.europa.eu/covid19/nationalcasedeath/json/"
 
+# Download chunk size for stream parsing
+CHUNK_SIZE = 64 * 1024
+
+# List of EU27 ISO3 country codes (ECDC country_code)
+EU27_COUNTRIES = [
+    "AUT", "BEL", "BGR", "HRV", "CYP", "CZE", "DNK", "EST", "FIN",
+    "FRA", "DEU", "GRC", "HUN", "IRL", "ITA", "LVA", "LTU", "LUX",
+    "MLT", "NLD", "POL", "PRT", "ROU", "SVK", "SVN", "ESP", "SWE",
+]
+
 # Environment variables (set via Terraform)
 S3_BUCKET = os.environ.get("S3_BUCKET")
 S3_PREFIX = os.environ.get("S3_PREFIX", "bronze/ecdc/")
@@ -15,51 +36,160 @@ S3_PREFIX = os.environ.get("S3_PREFIX", "bronze/ecdc/")
 s3_client = boto3.client("s3")
 
 
-def fetch_ecdc_covid_data():
+def iter_json_array(chunks):
+    """
+    Incrementally parse a top-level JSON array, yielding one element at a time.
+    Only the current unparsed tail is kept in memory.
+    Args:
+        chunks: Iterable of bytes
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf, pos, started, exhausted = "", 0, False, False
+
+    while True:
+        # skip whitespace and separators
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buf):
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                started, pos = True, pos + 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise
+            else:
+                # an element is complete only once a delimiter follows it
+                # (a number at the buffer edge may continue in the next chunk)
+                if exhausted or (end < len(buf) and buf[end] in " \t\r\n,]"):
+                    yield obj
+                    buf, pos = buf[end:], 0
+                    continue
+        elif exhausted:
+            raise ValueError("Unexpected end of JSON array")
+
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            buf += utf8.decode(b"", final=True)
+        else:
+            buf += utf8.decode(chunk)
+
+
+def iter_ecdc_records():
+    """
+    Stream ECDC national records without loading the whole response.
+    Yields:
+        dict: One record (country, indicator, year_week, ...)
     """
-    Fetch COVID-19 cases and deaths data from the ECDC API.
+    with requests.get(ECDC_COVID_URL, timeout=60, stream=True) as response:
+        response.raise_for_status()
+        yield from iter_json_array(response.iter_content(chunk_size=CHUNK_SIZE))
+
+
+def split_to_partitions(records, workdir: str) -> dict:
+    """
+    Keep EU27 records and spool them as JSON lines into one local file per country/year.
+    Memory stays bounded by a single record; partitions are written to /tmp.
+    Args:
+        records: Iterable of ECDC records
+        workdir (str): Local directory for partition files
     Returns:
-        dict: JSON response with records by country and date
+        dict: {(country_code, year): {"path": ..., "rows": n, "time_from": ..., "time_to": ...}}
     """
-    response = requests.get(ECDC_COVID_URL, timeout=60)
-    response.raise_for_status()
-    return response.json()
+    partitions, handles = {}, {}
+    try:
+        for rec in records:
+            country = rec.get("country_code")
+            year = (rec.get("year_week") or "")[:4]
+            if country not in EU27_COUNTRIES or not year.isdigit():
+                continue
+            part = (country, year)
+            if part not in handles:
+                path = os.path.join(workdir, f"{country}_{year}.jsonl")
+                handles[part] = open(path, "w", encoding="utf-8")
+                partitions[part] = {"path": path, "rows": 0, "time_from": None, "time_to": None}
+            handles[part].write(json.dumps(rec, ensure_ascii=False) + "\n")
+            info = partitions[part]
+            info["rows"] += 1
+            week = rec["year_week"]
+            info["time_from"] = week if info["time_from"] is None else min(info["time_from"], week)
+            info["time_to"] = week if info["time_to"] is None else max(info["time_to"], week)
+    finally:
+        for fh in handles.values():
+            fh.close()
+    return partitions
 
 
-def save_to_s3(data: dict, key: str):
+def partition_key(country: str, year: str) -> str:
+    """S3 key of one country/year partition (before the codec extension)."""
+    return f"{S3_PREFIX}national/country={country}/year={year}/ecdc_national.json"
+
+
+def save_partition_to_s3(path: str, key: str, ledger: dict = None) -> str:
     """
-    Save raw JSON data to S3 bronze layer.
+    Upload one spooled JSON-lines partition to S3 bronze layer.
     Args:
-        data (dict): The dataset to store
-        key (str): Target S3 object key
+        path (str): Local partition file
+        key (str): Target S3 object key (codec extension is appended)
+        ledger (dict): Ledger fields for this partition
+    Returns:
+        str: Final S3 object key
     """
+    with open(path, "rb") as fh:
+        raw = fh.read()
     try:
-        s3_client.put_object(
-            Bucket=S3_BUCKET,
-            Key=key,
-            Body=json.dumps(data),
-            ContentType="application/json"
-        )
+        return put_bytes(s3_client, S3_BUCKET, key, raw, "application/x-ndjson", ledger=ledger)
     except ClientError as e:
-        raise RuntimeError(f"Failed to upload to S3: {e}")
+        raise RuntimeError(f"Failed to upload {key} to S3: {e}")
 
 
 def lambda_handler(event, context):
     """
     AWS Lambda handler.
-    Extracts COVID-19 national cases/deaths data from ECDC and stores it in S3 (bronze).
+    Stream-parses ECDC national cases/deaths data and stores EU27 records in S3 (bronze),
+    partitioned by country and year as JSON lines.
+    Profiling (cProfile + tracemalloc) is enabled with {"profile": true} or PROFILE_HANDLER=1.
     """
-    data = fetch_ecdc_covid_data()
+    return run_with_profiling(_handle, event, context, s3_client, S3_BUCKET, "ecdc")
 
-    # Unique file name: use request ID
-    output_key = f"{S3_PREFIX}ecdc_covid_{context.aws_request_id}.json"
 
-    save_to_s3(data, output_key)
+def _handle(event, context):
+    """Run the ECDC ingestion (see lambda_handler)."""
+    reset_ledger()
+    stored_keys = {}
+    rows = 0
+
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            partitions = split_to_partitions(iter_ecdc_records(), workdir)
+            for (country, year), part in sorted(partitions.items()):
+                ledger = {
+                    "source": "ecdc",
+                    "dataset": f"national/{country}",
+                    "rows": part["rows"],
+                    "time_from": part["time_from"],
+                    "time_to": part["time_to"],
+                }
+                stored_keys[f"{country}/{year}"] = save_partition_to_s3(
+                    part["path"], partition_key(country, year), ledger)
+                checkpoint()
+                rows += part["rows"]
+    finally:
+        flush_ledger(s3_client, S3_BUCKET, "ecdc", context.aws_request_id)
 
     return {
         "statusCode": 200,
         "body": json.dumps({
             "message": "ECDC COVID-19 data successfully fetched and stored in S3 (bronze)",
-            "s3_key": output_key
+            "stored_files": stored_keys,
+            "records": rows
         })
     }
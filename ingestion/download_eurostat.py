@@ -4,6 +4,15 @@ import boto3
 import requests
 from botocore.exceptions import ClientError
 
+try:
+    from ingestion.s3_utils import put_json
+    from ingestion.profiling import run_with_profiling, checkpoint
+    from ingestion.ledger import flush_ledger, reset_ledger
+except ImportError:  # flat Lambda package: helpers sit next to this module
+    from s3_utils import put_json
+    from profiling import run_with_profiling, checkpoint
+    from ledger import flush_ledger, reset_ledger
+
 # Eurostat API base URL
 EUROSTAT_BASE_URL = "https://ec.europa.eu/eurostat/api/dissemination/statistics/1.0/data"
 
@@ -25,6 +34,14 @@ EUROSTAT_DATASETS = {
     "ilc_mdho06a": "Severe housing deprivation rate",
 }
 
+# Eurostat geo codes: EU27 aggregate plus member states (Greece is "EL" in Eurostat)
+EUROSTAT_GEOS = [
+    "EU27_2020",
+    "AT", "BE", "BG", "HR", "CY", "CZ", "DK", "EE", "FI", "FR", "DE", "EL",
+    "HU", "IE", "IT", "LV", "LT", "LU", "MT", "NL", "PL", "PT", "RO", "SK",
+    "SI", "ES", "SE",
+]
+
 # Environment variables (set via Terraform)
 S3_BUCKET = os.environ.get("S3_BUCKET")
 S3_PREFIX = os.environ.get("S3_PREFIX", "bronze/eurostat/")
@@ -35,14 +52,15 @@ s3_client = boto3.client("s3")
 
 def fetch_eurostat_dataset(dataset_code: str) -> dict:
     """
-    Fetch a dataset from Eurostat API (JSON-stat).
+    Fetch a dataset from Eurostat API (JSON-stat) for the EU27 aggregate and member states.
     Args:
         dataset_code (str): Eurostat dataset code
     Returns:
         dict: JSON response from Eurostat
     """
-    url = f"{EUROSTAT_BASE_URL}/{dataset_code}?lang=EN&geo=EU27_2020"
-    response = requests.get(url, timeout=60)
+    url = f"{EUROSTAT_BASE_URL}/{dataset_code}"
+    params = [("lang", "EN")] + [("geo", geo) for geo in EUROSTAT_GEOS]
+    response = requests.get(url, params=params, timeout=60)
     response.raise_for_status()
     return response.json()
 
@@ -56,13 +74,17 @@ def save_to_s3(data: dict, dataset_code: str, request_id: str):
         request_id (str): Lambda request ID for unique filenames
     """
     key = f"{S3_PREFIX}{dataset_code}_{request_id}.json"
+    periods = list((data.get("dimension", {}).get("time", {}).get("category", {}).get("index") or {}))
+    values = data.get("value") or {}
+    ledger = {
+        "source": "eurostat",
+        "dataset": dataset_code,
+        "rows": sum(v is not None for v in (values.values() if isinstance(values, dict) else values)),
+        "time_from": min(periods, default=None),
+        "time_to": max(periods, default=None),
+    }
     try:
-        s3_client.put_object(
-            Bucket=S3_BUCKET,
-            Key=key,
-            Body=json.dumps(data),
-            ContentType="application/json"
-        )
+        key = put_json(s3_client, S3_BUCKET, key, data, ledger=ledger)
     except ClientError as e:
         raise RuntimeError(f"Failed to upload {dataset_code} to S3: {e}")
     return key
@@ -72,13 +94,25 @@ def lambda_handler(event, context):
     """
     AWS Lambda handler.
     Extracts all 5 Eurostat datasets and stores them in S3 bronze layer.
+    Profiling (cProfile + tracemalloc) is enabled with {"profile": true} or PROFILE_HANDLER=1.
     """
+    return run_with_profiling(_handle, event, context, s3_client, S3_BUCKET, "eurostat")
+
+
+def _handle(event, context):
+    """Run the Eurostat ingestion (see lambda_handler)."""
+    reset_ledger()
     stored_keys = {}
 
-    for dataset_code, description in EUROSTAT_DATASETS.items():
-        data = fetch_eurostat_dataset(dataset_code)
-        key = save_to_s3(data, dataset_code, context.aws_request_id)
-        stored_keys[dataset_code] = key
+    try:
+        for dataset_code, description in EUROSTAT_DATASETS.items():
+            data = fetch_eurostat_dataset(dataset_code)
+            key = save_to_s3(data, dataset_code, context.aws_request_id)
+            checkpoint()
+            stored_keys[dataset_code] = key
+    finally:
+        # Record every object written in this run, even if a later dataset failed
+        flush_ledger(s3_client, S3_BUCKET, "eurostat", context.aws_request_id)
 
     return {
         "statusCode": 200,
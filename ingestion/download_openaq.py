@@ -1,12 +1,23 @@
 import os
 import json
+import math
 import time
 import boto3
 import requests
 import unicodedata
-from io import BytesIO
 from datetime import datetime, timezone
 
+try:
+    from ingestion.s3_utils import put_json, put_json_lines, get_json_if_exists, stored_key, INTERNAL_COMPRESSION
+    from ingestion.profiling import run_with_profiling, checkpoint
+    from ingestion.ledger import flush_ledger, reset_ledger
+    from ingestion.rollup_openaq import extract_hourly_values, update_sensor_rollups
+except ImportError:  # flat Lambda package: helpers sit next to this module
+    from s3_utils import put_json, put_json_lines, get_json_if_exists, stored_key, INTERNAL_COMPRESSION
+    from profiling import run_with_profiling, checkpoint
+    from ledger import flush_ledger, reset_ledger
+    from rollup_openaq import extract_hourly_values, update_sensor_rollups
+
 # === OpenAQ API v3 configuration ===
 OPENAQ_API_URL = "https://api.openaq.org/v3"
 API_KEY = os.environ.get("OPENAQ_API_KEY")  # required for v3
@@ -18,6 +29,10 @@ POLLUTANTS = {
     "no2": 7
 }
 
+# /locations filters: reference monitors measuring the selected pollutants only
+# (skips low-cost sensor networks, each of which would cost sensor and coverage calls)
+LOCATION_FILTERS = {"parameters_id": list(POLLUTANTS.values()), "monitor": "true"}
+
 # Time range: from 2024-01-01 to now
 DATE_FROM = "2024-01-01"
 DATE_TO = datetime.now(timezone.utc).strftime("%Y-%m-%d")
@@ -81,12 +96,62 @@ CITY_ALIASES = {
     "lisbon": ["lisboa"],
 }
 
+# City centroids (lat, lon) for coordinate-based location discovery
+CITY_CENTROIDS = {
+    "Vienna": (48.2082, 16.3738),
+    "Brussels": (50.8503, 4.3517),
+    "Sofia": (42.6977, 23.3219),
+    "Zagreb": (45.8150, 15.9819),
+    "Nicosia": (35.1856, 33.3823),
+    "Prague": (50.0755, 14.4378),
+    "Copenhagen": (55.6761, 12.5683),
+    "Tallinn": (59.4370, 24.7536),
+    "Helsinki": (60.1699, 24.9384),
+    "Paris": (48.8566, 2.3522),
+    "Marseille": (43.2965, 5.3698),
+    "Lyon": (45.7640, 4.8357),
+    "Berlin": (52.5200, 13.4050),
+    "Hamburg": (53.5511, 9.9937),
+    "Munich": (48.1351, 11.5820),
+    "Athens": (37.9838, 23.7275),
+    "Budapest": (47.4979, 19.0402),
+    "Dublin": (53.3498, -6.2603),
+    "Rome": (41.9028, 12.4964),
+    "Milan": (45.4642, 9.1900),
+    "Riga": (56.9496, 24.1052),
+    "Vilnius": (54.6872, 25.2797),
+    "Luxembourg": (49.6116, 6.1319),
+    "Valletta": (35.8989, 14.5146),
+    "Amsterdam": (52.3676, 4.9041),
+    "Warsaw": (52.2297, 21.0122),
+    "Krakow": (50.0647, 19.9450),
+    "Lisbon": (38.7223, -9.1393),
+    "Bucharest": (44.4268, 26.1025),
+    "Bratislava": (48.1486, 17.1077),
+    "Ljubljana": (46.0569, 14.5058),
+    "Madrid": (40.4168, -3.7038),
+    "Barcelona": (41.3851, 2.1734),
+    "Stockholm": (59.3293, 18.0686),
+}
+
+# Search radius around a city centroid (OpenAQ v3 allows at most 25 km)
+CITY_RADIUS_M = 25000
+
+# Cell size (degrees) of the local city grid index
+CITY_GRID_CELL_DEG = 0.5
+
 
 # AWS S3 configuration
 S3_BUCKET = os.environ.get("S3_BUCKET")
 S3_PREFIX = os.environ.get("S3_PREFIX", "bronze/openaq/v3/eu27/")
 s3 = boto3.client("s3")
 
+# Hourly "latest" mode: hot partition (expired by an S3 lifecycle rule) and the sensors
+# chosen by the last full run. Both live outside S3_PREFIX, which holds only country directories.
+LATEST_PREFIX = os.environ.get("LATEST_PREFIX", "bronze/openaq/latest/")
+STATE_PREFIX = os.environ.get("OPENAQ_STATE_PREFIX", "bronze/openaq/_state/")
+SELECTED_SENSORS_NAME = "selected_sensors.json"
+
 # --- utility functions ---
 
 def _norm(txt: str) -> str:
@@ -106,6 +171,39 @@ def _city_matches(locality: str, target: str) -> bool:
     aliases = CITY_ALIASES.get(n_tar, [])
     return n_loc in {_norm(a) for a in ([target] + aliases)}
 
+def _haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in meters."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6371000.0 * math.asin(math.sqrt(a))
+
+def _grid_cell(lat: float, lon: float) -> tuple:
+    return (math.floor(lat / CITY_GRID_CELL_DEG), math.floor(lon / CITY_GRID_CELL_DEG))
+
+def build_city_grid(centroids: dict) -> dict:
+    """Bucket city centroids into a lat/lon grid: {(row, col): [(city, lat, lon)]}."""
+    grid = {}
+    for city, (lat, lon) in centroids.items():
+        grid.setdefault(_grid_cell(lat, lon), []).append((city, lat, lon))
+    return grid
+
+def nearest_city(grid: dict, lat: float, lon: float, max_m: float = CITY_RADIUS_M):
+    """Return the closest city within max_m of (lat, lon), scanning only neighbouring grid cells."""
+    row, col = _grid_cell(lat, lon)
+    d_row = math.ceil(max_m / 111320.0 / CITY_GRID_CELL_DEG)
+    d_col = math.ceil(max_m / (111320.0 * max(math.cos(math.radians(lat)), 0.01)) / CITY_GRID_CELL_DEG)
+    best, best_m = None, max_m
+    for r in range(row - d_row, row + d_row + 1):
+        for c in range(col - d_col, col + d_col + 1):
+            for city, c_lat, c_lon in grid.get((r, c), []):
+                dist = _haversine_m(lat, lon, c_lat, c_lon)
+                if dist <= best_m:
+                    best, best_m = city, dist
+    return best
+
+CITY_GRID = build_city_grid(CITY_CENTROIDS)
+
 def _request(url: str, params: dict = None, retries: int = 3, backoff: float = 1.5):
     """Perform API request with retry on 429 errors."""
     if not API_KEY:
@@ -119,33 +217,72 @@ def _request(url: str, params: dict = None, retries: int = 3, backoff: float = 1
         return r.json()
     r.raise_for_status()
 
-def list_locations_for_city(iso: str, city: str):
-    """Fetch all locations in a country and filter by city name."""
+def _paginate_locations(params: dict):
+    """Yield locations for the given /locations query, following pagination."""
     url = f"{OPENAQ_API_URL}/locations"
     page = 1
-    out = []
     while True:
-        data = _request(url, params={"iso": iso, "limit": 1000, "page": page})
-        for loc in data.get("results", []):
-            locality = loc.get("locality") or loc.get("name")
-            if locality and _city_matches(locality, city):
-                out.append(loc)
+        data = _request(url, params={**params, "limit": 1000, "page": page})
+        yield from data.get("results", [])
         found = data.get("meta", {}).get("found") or 0
         limit = data.get("meta", {}).get("limit") or 1000
         if page * limit >= found:
             break
         page += 1
+
+def list_locations_for_city(iso: str, city: str):
+    """
+    Fetch locations around a city centroid (server-side radius query) and keep those
+    whose nearest city in the local grid index is this city.
+    Falls back to country-wide name matching for cities without a centroid.
+    """
+    if city not in CITY_CENTROIDS:
+        return list_locations_by_name(iso, city)
+    lat, lon = CITY_CENTROIDS[city]
+    out = []
+    for loc in _paginate_locations({**LOCATION_FILTERS, "coordinates": f"{lat},{lon}", "radius": CITY_RADIUS_M}):
+        country = (loc.get("country") or {}).get("code")
+        if country and country != iso:
+            continue
+        coords = loc.get("coordinates") or {}
+        if coords.get("latitude") is not None and coords.get("longitude") is not None:
+            if nearest_city(CITY_GRID, coords["latitude"], coords["longitude"]) == city:
+                out.append(loc)
+        elif _city_matches(loc.get("locality") or loc.get("name"), city):
+            out.append(loc)
+    return out
+
+def list_locations_by_name(iso: str, city: str):
+    """Fetch all locations in a country and filter by city name."""
+    out = []
+    for loc in _paginate_locations({**LOCATION_FILTERS, "iso": iso}):
+        locality = loc.get("locality") or loc.get("name")
+        if locality and _city_matches(locality, city):
+            out.append(loc)
     return out
 
 def list_sensors_for_locations(location_ids):
-    """Fetch sensors for given location IDs."""
+    """Fetch sensors for given location IDs (each tagged with its location_id)."""
     sensors = []
     for lid in location_ids:
         url = f"{OPENAQ_API_URL}/locations/{lid}/sensors"
         data = _request(url, params={"limit": 1000, "page": 1})
-        sensors.extend(data.get("results", []))
+        sensors.extend({**s, "location_id": lid} for s in data.get("results", []))
     return sensors
 
+def sensors_for_locations(locations):
+    """
+    Collect sensors from the `sensors` array of /locations results (each tagged with its location_id).
+    Only locations returned without that array cost a /locations/{id}/sensors call.
+    """
+    sensors, missing = [], []
+    for loc in locations:
+        if "sensors" in loc:
+            sensors.extend({**s, "location_id": loc["id"]} for s in loc["sensors"] or [])
+        else:
+            missing.append(loc["id"])
+    return sensors + list_sensors_for_locations(missing)
+
 def sensor_coverage_hours(sensor_id: int, date_from: str, date_to: str):
     """Check coverage (observed hours) for a sensor in given time range."""
     url = f"{OPENAQ_API_URL}/sensors/{sensor_id}/measurements/hourly"
@@ -177,23 +314,22 @@ def pick_best_sensor_per_parameter(sensors, param_id: int, date_from: str, date_
             best = s
     return best, best_cnt
 
-def save_json_to_s3(obj: dict, key: str):
-    """Save JSON object to S3."""
-    s3.put_object(
-        Bucket=S3_BUCKET,
-        Key=key,
-        Body=BytesIO(json.dumps(obj, ensure_ascii=False).encode("utf-8")),
-        ContentType="application/json",
-    )
+def save_json_to_s3(obj: dict, key: str, ledger: dict = None):
+    """Save JSON object to S3 (compressed), optionally recording it in the ledger; returns the final key."""
+    return put_json(s3, S3_BUCKET, key, obj, ledger=ledger)
 
 def stream_hourly_to_s3(sensor_id: int, country: str, city: str, param_name: str,
                         date_from: str, date_to: str, request_id: str):
-    """Stream hourly measurements for a sensor to S3 with pagination."""
+    """
+    Stream hourly measurements for a sensor to S3 with pagination,
+    then merge the fetched hours into the sensor's daily/monthly rollups.
+    """
     url = f"{OPENAQ_API_URL}/sensors/{sensor_id}/measurements/hourly"
     page = 1
     total_found = None
     ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
     city_slug = _norm(city).replace(" ", "-")
+    hourly = {}
     while True:
         data = _request(url, params={
             "datetime_from": date_from,
@@ -206,65 +342,191 @@ def stream_hourly_to_s3(sensor_id: int, country: str, city: str, param_name: str
         limit = meta.get("limit") or 1000
         total_found = found if total_found is None else total_found
         part_key = f"{S3_PREFIX}{country}/{city_slug}/{param_name}/sensor={sensor_id}/page={page}_{request_id}_{ts}.json"
-        save_json_to_s3(data, part_key)
+        page_hours = extract_hourly_values(data)
+        save_json_to_s3(data, part_key, ledger={
+            "source": "openaq",
+            "dataset": f"{country}/{city_slug}/{param_name}/sensor={sensor_id}",
+            "rows": len(data.get("results", [])),
+            "time_from": min(page_hours, default=None),
+            "time_to": max(page_hours, default=None),
+        })
+        hourly.update(page_hours)
+        checkpoint()
         if page * limit >= found or found == 0:
             break
         page += 1
+    if hourly:
+        try:
+            update_sensor_rollups(s3, S3_BUCKET, country, city_slug, param_name, sensor_id, hourly)
+        except Exception as e:
+            # Rollups are derived data: bronze pages are stored and the ledger-driven
+            # rollup_openaq Lambda (hourly rollup-openaq-schedule) picks them up on its next run
+            print(f"WARN: rollup update failed for sensor {sensor_id}: {e}")
     return total_found or 0
 
+def save_selected_sensors(summary: list):
+    """Merge this run's chosen sensors into the selection used by the "latest" mode."""
+    key = stored_key(f"{STATE_PREFIX}{SELECTED_SENSORS_NAME}", INTERNAL_COMPRESSION)
+    selected = get_json_if_exists(s3, S3_BUCKET, key, default={"sensors": {}})
+    for item in summary:
+        for pname, info in item["chosen"].items():
+            selected["sensors"][f"{item['iso']}:{item['city']}:{pname}"] = {
+                "iso": item["iso"],
+                "city": item["city"],
+                "parameter": pname,
+                "sensor_id": info["sensor_id"],
+                "location_id": info.get("location_id"),
+            }
+    selected["updated_at"] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    put_json(s3, S3_BUCKET, f"{STATE_PREFIX}{SELECTED_SENSORS_NAME}", selected, codec=INTERNAL_COMPRESSION)
+
+def fetch_latest_readings(selected: list):
+    """
+    Fetch the latest reading of each selected sensor.
+    Sensors are batched per location: one /locations/{id}/latest call covers all of them.
+    Returns:
+        tuple: (rows, number of API calls)
+    """
+    fetched_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    by_location = {}
+    for item in selected:
+        by_location.setdefault(item.get("location_id"), []).append(item)
+
+    rows, calls = [], 0
+    for lid, items in by_location.items():
+        if lid is None:
+            # selections made before location IDs were recorded: one call per sensor
+            latest = {}
+            for item in items:
+                data = _request(f"{OPENAQ_API_URL}/sensors/{item['sensor_id']}")
+                calls += 1
+                for res in data.get("results", []):
+                    if res.get("latest"):
+                        latest[res.get("id")] = {**res["latest"], "sensorsId": res.get("id")}
+        else:
+            data = _request(f"{OPENAQ_API_URL}/locations/{lid}/latest", params={"limit": 1000})
+            calls += 1
+            latest = {res.get("sensorsId"): res for res in data.get("results", [])}
+        for item in items:
+            res = latest.get(item["sensor_id"])
+            if not res or res.get("value") is None:
+                continue
+            rows.append({
+                **item,
+                "value": res["value"],
+                "datetime_utc": (res.get("datetime") or {}).get("utc"),
+                "fetched_at": fetched_at,
+            })
+    return rows, calls
+
+def run_latest(request_id: str):
+    """Hourly mode: append latest readings of the selected sensors to the hot partition."""
+    selected = get_json_if_exists(s3, S3_BUCKET, stored_key(f"{STATE_PREFIX}{SELECTED_SENSORS_NAME}", INTERNAL_COMPRESSION), default={"sensors": {}})
+    if not selected["sensors"]:
+        return {"statusCode": 200, "body": json.dumps({"mode": "latest", "message": "WARN: no selected sensors yet"})}
+
+    rows, calls = fetch_latest_readings(list(selected["sensors"].values()))
+    checkpoint()
+    now = datetime.now(timezone.utc)
+    key = None
+    if rows:
+        times = [r["datetime_utc"] for r in rows if r["datetime_utc"]]
+        key = put_json_lines(
+            s3, S3_BUCKET,
+            f"{LATEST_PREFIX}date={now:%Y-%m-%d}/hour={now:%H}/latest_{request_id}.json",
+            rows,
+            ledger={"source": "openaq", "dataset": "latest", "rows": len(rows),
+                    "time_from": min(times, default=None), "time_to": max(times, default=None)},
+        )
+
+    return {
+        "statusCode": 200,
+        "body": json.dumps({"mode": "latest", "s3_key": key, "readings": len(rows), "api_calls": calls})
+    }
+
 def lambda_handler(event, context):
-    """Main Lambda handler: iterate EU27 countries and save hourly data to S3."""
+    """
+    Main Lambda handler: iterate EU27 countries and save hourly data to S3.
+    With {"mode": "latest"} only the latest readings of the already selected sensors are stored.
+    Profiling (cProfile + tracemalloc) is enabled with {"profile": true} or PROFILE_HANDLER=1.
+    """
+    return run_with_profiling(_handle, event, context, s3, S3_BUCKET, "openaq")
+
+def _handle(event, context):
+    """Run the OpenAQ ingestion (see lambda_handler)."""
     if not S3_BUCKET:
         return {"statusCode": 500, "body": json.dumps({"error": "Missing S3_BUCKET in env"})}
     if not API_KEY:
         return {"statusCode": 500, "body": json.dumps({"error": "Missing OPENAQ_API_KEY in env (required for v3)"})}
 
+    request_id = context.aws_request_id if context else "local"
+    reset_ledger()
+
+    if isinstance(event, dict) and event.get("mode") == "latest":
+        try:
+            return run_latest(request_id)
+        finally:
+            flush_ledger(s3, S3_BUCKET, "openaq", request_id)
+
     stored = {}
     summary = []
-    for iso in EU27_COUNTRIES:
-        limit = CITY_LIMITS.get(iso, CITY_LIMITS["default"])
-        cities = TOP_CITIES_BY_COUNTRY.get(iso, [])[:limit]
-        for city in cities:
-            city_key = f"{iso}:{city}"
-            try:
-                locs = list_locations_for_city(iso, city)
-                if not locs:
-                    stored[city_key] = "WARN: no locations found in OpenAQ"
-                    continue
-                loc_ids = [loc["id"] for loc in locs]
-                sensors = list_sensors_for_locations(loc_ids)
-
-                chosen = {}
-                for pname, pid in POLLUTANTS.items():
-                    best, observed = pick_best_sensor_per_parameter(sensors, pid, DATE_FROM, DATE_TO)
-                    if not best:
-                        stored[f"{city_key}_{pname}"] = "WARN: no sensor for parameter"
+    try:
+        for iso in EU27_COUNTRIES:
+            limit = CITY_LIMITS.get(iso, CITY_LIMITS["default"])
+            cities = TOP_CITIES_BY_COUNTRY.get(iso, [])[:limit]
+            for city in cities:
+                city_key = f"{iso}:{city}"
+                try:
+                    locs = list_locations_for_city(iso, city)
+                    if not locs:
+                        stored[city_key] = "WARN: no locations found in OpenAQ"
                         continue
-                    sid = best["id"]
-                    n_saved = stream_hourly_to_s3(
-                        sensor_id=sid,
-                        country=iso,
-                        city=city,
-                        param_name=pname,
-                        date_from=DATE_FROM,
-                        date_to=DATE_TO,
-                        request_id=context.aws_request_id if context else "local"
-                    )
-                    stored[f"{city_key}_{pname}"] = f"OK: sensor {sid}, records={n_saved}"
-                    chosen[pname] = {"sensor_id": sid, "observed_hours": observed}
-
-                # Write city manifest
-                manifest_key = f"{S3_PREFIX}{iso}/{_norm(city).replace(' ','-')}/_manifest_{context.aws_request_id if context else 'local'}.json"
-                save_json_to_s3({
-                    "iso": iso,
-                    "city": city,
-                    "date_from": DATE_FROM,
-                    "date_to": DATE_TO,
-                    "chosen_sensors": chosen
-                }, manifest_key)
-                summary.append({"iso": iso, "city": city, "chosen": chosen})
-            except Exception as e:
-                stored[city_key] = f"ERROR: {str(e)}"
+                    sensors = sensors_for_locations(locs)
+
+                    chosen = {}
+                    for pname, pid in POLLUTANTS.items():
+                        best, observed = pick_best_sensor_per_parameter(sensors, pid, DATE_FROM, DATE_TO)
+                        if not best:
+                            stored[f"{city_key}_{pname}"] = "WARN: no sensor for parameter"
+                            continue
+                        sid = best["id"]
+                        n_saved = stream_hourly_to_s3(
+                            sensor_id=sid,
+                            country=iso,
+                            city=city,
+                            param_name=pname,
+                            date_from=DATE_FROM,
+                            date_to=DATE_TO,
+                            request_id=request_id
+                        )
+                        stored[f"{city_key}_{pname}"] = f"OK: sensor {sid}, records={n_saved}"
+                        chosen[pname] = {"sensor_id": sid, "observed_hours": observed,
+                                         "location_id": best.get("location_id")}
+
+                    # Write city manifest
+                    manifest_key = f"{S3_PREFIX}{iso}/{_norm(city).replace(' ','-')}/_manifest_{request_id}.json"
+                    save_json_to_s3({
+                        "iso": iso,
+                        "city": city,
+                        "date_from": DATE_FROM,
+                        "date_to": DATE_TO,
+                        "chosen_sensors": chosen
+                    }, manifest_key, ledger={
+                        "source": "openaq",
+                        "dataset": f"{iso}/{_norm(city).replace(' ', '-')}/_manifest",
+                        "rows": len(chosen),
+                        "time_from": DATE_FROM,
+                        "time_to": DATE_TO,
+                    })
+                    summary.append({"iso": iso, "city": city, "chosen": chosen})
+                except Exception as e:
+                    stored[city_key] = f"ERROR: {str(e)}"
+
+        if summary:
+            save_selected_sensors(summary)
+    finally:
+        # Record every page written in this run, even if the run failed part-way
+        flush_ledger(s3, S3_BUCKET, "openaq", request_id)
 
     return {
         "statusCode": 200,
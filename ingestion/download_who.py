@@ -4,6 +4,15 @@ import boto3
 import requests
 from botocore.exceptions import ClientError
 
+try:
+    from ingestion.s3_utils import put_json
+    from ingestion.profiling import run_with_profiling, checkpoint
+    from ingestion.ledger import flush_ledger, reset_ledger
+except ImportError:  # flat Lambda package: helpers sit next to this module
+    from s3_utils import put_json
+    from profiling import run_with_profiling, checkpoint
+    from ledger import flush_ledger, reset_ledger
+
 # WHO GHO API base URL
 WHO_BASE_URL = "https://ghoapi.azureedge.net/api"
 
@@ -97,13 +106,16 @@ def save_to_s3(data: dict, indicator_code: str, request_id: str):
         request_id (str): Lambda request ID
     """
     key = f"{S3_PREFIX}{indicator_code}_{request_id}.json"
+    years = [str(rec["TimeDim"]) for rec in data.get("records", []) if rec.get("TimeDim") is not None]
+    ledger = {
+        "source": "who",
+        "dataset": indicator_code,
+        "rows": len(data.get("records", [])),
+        "time_from": min(years, default=None),
+        "time_to": max(years, default=None),
+    }
     try:
-        s3_client.put_object(
-            Bucket=S3_BUCKET,
-            Key=key,
-            Body=json.dumps(data),
-            ContentType="application/json"
-        )
+        key = put_json(s3_client, S3_BUCKET, key, data, ledger=ledger)
     except ClientError as e:
         raise RuntimeError(f"Failed to upload {indicator_code} to S3: {e}")
     return key
@@ -113,13 +125,25 @@ def lambda_handler(event, context):
     """
     AWS Lambda handler.
     Fetches all WHO indicators and stores them in S3 bronze layer.
+    Profiling (cProfile + tracemalloc) is enabled with {"profile": true} or PROFILE_HANDLER=1.
     """
+    return run_with_profiling(_handle, event, context, s3_client, S3_BUCKET, "who")
+
+
+def _handle(event, context):
+    """Run the WHO ingestion (see lambda_handler)."""
+    reset_ledger()
     stored_keys = {}
 
-    for indicator_code, description in WHO_INDICATORS.items():
-        data = fetch_who_indicator(indicator_code)
-        key = save_to_s3(data, indicator_code, context.aws_request_id)
-        stored_keys[indicator_code] = key
+    try:
+        for indicator_code, description in WHO_INDICATORS.items():
+            data = fetch_who_indicator(indicator_code)
+            key = save_to_s3(data, indicator_code, context.aws_request_id)
+            checkpoint()
+            stored_keys[indicator_code] = key
+    finally:
+        # Record every object written in this run, even if a later indicator failed
+        flush_ledger(s3_client, S3_BUCKET, "who", context.aws_request_id)
 
     return {
         "statusCode": 200,
@@ -0,0 +1,454 @@
+import os
+import json
+import hashlib
+import boto3
+
+try:
+    from ingestion.s3_utils import (put_json, put_json_lines, get_json, get_json_lines, get_json_if_exists, stored_key,
+                                    INTERNAL_COMPRESSION)
+    from ingestion.rollup_openaq import ROLLUP_PREFIX, merge_aggregates
+except ImportError:  # flat Lambda package: helpers sit next to this module
+    from s3_utils import (put_json, put_json_lines, get_json, get_json_lines, get_json_if_exists, stored_key,
+                          INTERNAL_COMPRESSION)
+    from rollup_openaq import ROLLUP_PREFIX, merge_aggregates
+
+# Environment variables (set via Terraform)
+S3_BUCKET = os.environ.get("S3_BUCKET")
+WHO_PREFIX = os.environ.get("WHO_PREFIX", "bronze/who/")
+EUROSTAT_PREFIX = os.environ.get("EUROSTAT_PREFIX", "bronze/eurostat/")
+ECDC_PREFIX = os.environ.get("ECDC_PREFIX", "bronze/ecdc/")
+OPENAQ_STATE_PREFIX = os.environ.get("OPENAQ_STATE_PREFIX", "bronze/openaq/_state/")
+GOLD_PREFIX = os.environ.get("GOLD_PREFIX", "gold/")
+
+# Output locations (underscore-prefixed objects are ignored by Athena)
+COUNTRY_YEAR_PREFIX = f"{GOLD_PREFIX}country_year/"
+DIM_COUNTRY_KEY = f"{GOLD_PREFIX}dim_country/dim_country.json"
+BUILD_STATE_KEY = f"{COUNTRY_YEAR_PREFIX}_build_state.json"
+
+# Sensors picked by the last OpenAQ full runs; only their rollups feed the openaq_* features
+OPENAQ_SELECTION_KEY = f"{OPENAQ_STATE_PREFIX}selected_sensors.json"
+
+# Precomputed geo dimension: ISO2 (OpenAQ), ISO3 (WHO, ECDC) and Eurostat geo codes
+GEO_DIMENSION = [
+    {"iso2": "AT", "iso3": "AUT", "eurostat_geo": "AT", "country": "Austria"},
+    {"iso2": "BE", "iso3": "BEL", "eurostat_geo": "BE", "country": "Belgium"},
+    {"iso2": "BG", "iso3": "BGR", "eurostat_geo": "BG", "country": "Bulgaria"},
+    {"iso2": "HR", "iso3": "HRV", "eurostat_geo": "HR", "country": "Croatia"},
+    {"iso2": "CY", "iso3": "CYP", "eurostat_geo": "CY", "country": "Cyprus"},
+    {"iso2": "CZ", "iso3": "CZE", "eurostat_geo": "CZ", "country": "Czechia"},
+    {"iso2": "DK", "iso3": "DNK", "eurostat_geo": "DK", "country": "Denmark"},
+    {"iso2": "EE", "iso3": "EST", "eurostat_geo": "EE", "country": "Estonia"},
+    {"iso2": "FI", "iso3": "FIN", "eurostat_geo": "FI", "country": "Finland"},
+    {"iso2": "FR", "iso3": "FRA", "eurostat_geo": "FR", "country": "France"},
+    {"iso2": "DE", "iso3": "DEU", "eurostat_geo": "DE", "country": "Germany"},
+    {"iso2": "GR", "iso3": "GRC", "eurostat_geo": "EL", "country": "Greece"},
+    {"iso2": "HU", "iso3": "HUN", "eurostat_geo": "HU", "country": "Hungary"},
+    {"iso2": "IE", "iso3": "IRL", "eurostat_geo": "IE", "country": "Ireland"},
+    {"iso2": "IT", "iso3": "ITA", "eurostat_geo": "IT", "country": "Italy"},
+    {"iso2": "LV", "iso3": "LVA", "eurostat_geo": "LV", "country": "Latvia"},
+    {"iso2": "LT", "iso3": "LTU", "eurostat_geo": "LT", "country": "Lithuania"},
+    {"iso2": "LU", "iso3": "LUX", "eurostat_geo": "LU", "country": "Luxembourg"},
+    {"iso2": "MT", "iso3": "MLT", "eurostat_geo": "MT", "country": "Malta"},
+    {"iso2": "NL", "iso3": "NLD", "eurostat_geo": "NL", "country": "Netherlands"},
+    {"iso2": "PL", "iso3": "POL", "eurostat_geo": "PL", "country": "Poland"},
+    {"iso2": "PT", "iso3": "PRT", "eurostat_geo": "PT", "country": "Portugal"},
+    {"iso2": "RO", "iso3": "ROU", "eurostat_geo": "RO", "country": "Romania"},
+    {"iso2": "SK", "iso3": "SVK", "eurostat_geo": "SK", "country": "Slovakia"},
+    {"iso2": "SI", "iso3": "SVN", "eurostat_geo": "SI", "country": "Slovenia"},
+    {"iso2": "ES", "iso3": "ESP", "eurostat_geo": "ES", "country": "Spain"},
+    {"iso2": "SE", "iso3": "SWE", "eurostat_geo": "SE", "country": "Sweden"},
+]
+GEO_BY_ISO2 = {g["iso2"]: g for g in GEO_DIMENSION}
+ISO2_BY_ISO3 = {g["iso3"]: g["iso2"] for g in GEO_DIMENSION}
+ISO2_BY_EUROSTAT = {g["eurostat_geo"]: g["iso2"] for g in GEO_DIMENSION}
+
+# Headline slice per WHO indicator: {DimType: code} for every dimension the records carry.
+# Records with any other dimension value are ignored; indicators not listed here are skipped.
+WHO_SLICES = {
+    "AIR_10": {"SEX": "SEX_BTSX"},
+    "AIR_12": {"SEX": "SEX_BTSX"},
+    "AIR_15": {"SEX": "SEX_BTSX"},
+    "AIR_16": {"SEX": "SEX_BTSX"},
+    "AIR_35": {"SEX": "SEX_BTSX"},
+    "AIR_42": {"SEX": "SEX_BTSX"},
+    "AIR_46": {"SEX": "SEX_BTSX"},
+    "AIR_6": {"SEX": "SEX_BTSX"},
+    "AIR_60": {"SEX": "SEX_BTSX"},
+    "AIR_62": {"SEX": "SEX_BTSX"},
+    "TOTENV_3": {"SEX": "SEX_BTSX"},
+    "TOTENV_90": {"SEX": "SEX_BTSX"},
+    # MORT_500 / MORT_700 (cause x age x sex) are not in the table until a headline slice is agreed
+}
+
+# Headline slice per Eurostat dataset: {dimension: code} for every dimension except geo/time.
+# Single-category dimensions (e.g. freq) need no entry; datasets not listed here are skipped.
+EUROSTAT_SLICES = {
+    # deaths from diseases of the respiratory system, both sexes, all ages, all deaths in the country
+    "hlth_cd_aro": {"unit": "NR", "sex": "T", "age": "TOTAL", "icd10": "J", "resid": "TOT_IN"},
+    # standardised death rate, respiratory diseases, both sexes, all ages
+    "hlth_cd_asdr2": {"unit": "RT", "sex": "T", "age": "TOTAL", "icd10": "J"},
+    # PM2.5 emissions, national total, tonnes
+    "env_air_emis": {"airpol": "PM2_5", "src_nfr": "NFR_TOT_NAT", "unit": "T"},
+    # PM2.5 emissions, all NACE activities, tonnes
+    "env_ac_ainah_r2": {"airpol": "PM2_5", "nace_r2": "TOTAL", "unit": "T"},
+    # all greenhouse gases, total excl. LULUCF incl. memo items, million tonnes CO2 equivalent
+    "env_air_gge": {"airpol": "GHG", "src_crf": "TOTX4_MEMO", "unit": "MIO_T"},
+    # GDP per capita, current prices, PPS
+    "nama_10_pc": {"unit": "CP_PPS_EU27_2020_HAB", "na_item": "B1GQ"},
+    # Gini coefficient of equivalised disposable income
+    "ilc_di12": {"statinfo": "GINI_HND"},
+    # at-risk-of-poverty rate (60% of median), both sexes, all ages, percent
+    "ilc_li02": {"indic_il": "LI_R_MD60", "sex": "T", "age": "TOTAL", "unit": "PC"},
+    # tertiary education (ISCED 5-8), both sexes, aged 25-64, percent
+    "edat_lfse_03": {"isced11": "ED5-8", "sex": "T", "age": "Y25-64", "unit": "PC"},
+    # unmet need for medical examination (too expensive, too far, waiting list), aged 16+, percent
+    "hlth_silc_08": {"reason": "TOOEFW", "quantile": "TOTAL", "sex": "T", "age": "Y_GE16", "unit": "PC"},
+    # overcrowding rate, whole population, percent
+    "ilc_lvho05a": {"incgrp": "TOTAL", "sex": "T", "age": "TOTAL", "unit": "PC"},
+    # severe housing deprivation rate, whole population, percent
+    "ilc_mdho06a": {"incgrp": "TOTAL", "sex": "T", "age": "TOTAL", "unit": "PC"},
+}
+
+# Cached features in the build state are invalid once a slice changes
+SLICE_CONFIG = hashlib.sha256(
+    json.dumps([WHO_SLICES, EUROSTAT_SLICES], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+# AWS S3 client
+s3_client = boto3.client("s3")
+
+
+# --- helpers ---
+
+def _cell(iso2: str, year) -> str:
+    return f"{iso2}|{int(year)}"
+
+
+def _object_name(key: str) -> str:
+    """File name without codec/JSON extension."""
+    return key.rsplit("/", 1)[-1].split(".json", 1)[0]
+
+
+# --- feature extraction per source: {"<iso2>|<year>": {feature: value}} ---
+
+def extract_who(data: dict) -> dict:
+    """
+    Extract the configured headline value (WHO_SLICES) per country-year for a WHO indicator.
+    Records broken down by other dimension values are ignored; an unconfigured indicator or
+    a slice matching several values of one country-year yields no features.
+    """
+    indicator = data.get("indicator", "")
+    wanted = WHO_SLICES.get(indicator)
+    if wanted is None:
+        print(f"WARN: no headline slice configured for WHO indicator {indicator}, skipped")
+        return {}
+
+    feature = f"who_{indicator.lower()}"
+    out, unmatched = {}, set()
+    for rec in data.get("records", []):
+        iso2 = ISO2_BY_ISO3.get(rec.get("SpatialDim"))
+        value = rec.get("NumericValue")
+        if not iso2 or value is None or rec.get("TimeDim") is None:
+            continue
+        dims = {rec.get(f"Dim{n}Type"): rec.get(f"Dim{n}") for n in (1, 2, 3) if rec.get(f"Dim{n}") is not None}
+        if dims != wanted:
+            unmatched.add(tuple(sorted(map(str, dims))))
+            continue
+        cell = _cell(iso2, rec["TimeDim"])
+        if cell in out and out[cell][feature] != value:
+            print(f"WARN: WHO indicator {indicator} slice {wanted} is not unique for {cell}, skipped")
+            return {}
+        out[cell] = {feature: value}
+    if not out and unmatched:
+        seen = ", ".join("/".join(types) or "-" for types in sorted(unmatched))
+        print(f"WARN: WHO indicator {indicator} has no records matching slice {wanted} "
+              f"(dimension types seen: {seen}), skipped")
+    return out
+
+
+def extract_eurostat(data: dict, dataset_code: str) -> dict:
+    """
+    Decode a JSON-stat dataset into one annual value per country-year.
+    Dimensions other than geo/time are fixed to the codes in EUROSTAT_SLICES; a dataset without
+    a configured slice (or with an unconfigured multi-category dimension) yields no features.
+    """
+    ids, sizes, dims = data.get("id", []), data.get("size", []), data.get("dimension", {})
+    if "geo" not in ids or "time" not in ids:
+        return {}
+    wanted = EUROSTAT_SLICES.get(dataset_code)
+    if wanted is None:
+        print(f"WARN: no headline slice configured for Eurostat dataset {dataset_code}, skipped")
+        return {}
+
+    positions = []
+    for dim_id in ids:
+        index = dims[dim_id]["category"]["index"]
+        positions.append({code: i for i, code in enumerate(index)} if isinstance(index, list) else index)
+
+    strides = [1] * len(ids)
+    for i in range(len(ids) - 2, -1, -1):
+        strides[i] = strides[i + 1] * sizes[i + 1]
+
+    fixed = {}
+    for i, dim_id in enumerate(ids):
+        if dim_id in ("geo", "time"):
+            continue
+        if dim_id in wanted:
+            code = wanted[dim_id]
+        elif sizes[i] == 1:
+            code = next(iter(positions[i]))
+        else:
+            print(f"WARN: Eurostat dataset {dataset_code} has unconfigured dimension {dim_id}, skipped")
+            return {}
+        if code not in positions[i]:
+            print(f"WARN: Eurostat dataset {dataset_code} has no {dim_id}={code}, skipped")
+            return {}
+        fixed[i] = positions[i][code]
+
+    geo_i, time_i = ids.index("geo"), ids.index("time")
+    geo_by_pos = {pos: code for code, pos in positions[geo_i].items()}
+    time_by_pos = {pos: code for code, pos in positions[time_i].items()}
+
+    values = data.get("value", {})
+    items = values.items() if isinstance(values, dict) else enumerate(values)
+    feature = f"eurostat_{dataset_code}"
+    out = {}
+    for flat, value in items:
+        if value is None:
+            continue
+        flat = int(flat)
+        coords = [(flat // strides[i]) % sizes[i] for i in range(len(ids))]
+        if any(coords[i] != pos for i, pos in fixed.items()):
+            continue
+        iso2 = ISO2_BY_EUROSTAT.get(geo_by_pos.get(coords[geo_i]))
+        period = time_by_pos.get(coords[time_i], "")
+        if iso2 and len(period) == 4 and period.isdigit():
+            out[_cell(iso2, period)] = {feature: value}
+    return out
+
+
+def extract_ecdc(data) -> dict:
+    """Sum ECDC weekly counts into annual totals per country and indicator."""
+    records = data.get("records", []) if isinstance(data, dict) else data
+    out = {}
+    for rec in records:
+        iso2 = ISO2_BY_ISO3.get(rec.get("country_code"))
+        year_week = rec.get("year_week") or ""
+        count = rec.get("weekly_count")
+        if not iso2 or count is None or len(year_week) < 4:
+            continue
+        features = out.setdefault(_cell(iso2, year_week[:4]), {})
+        name = f"ecdc_{rec.get('indicator')}"
+        features[name] = features.get(name, 0) + count
+    return out
+
+
+def extract_openaq(data: dict) -> dict:
+    """Merge one sensor's monthly rollups into annual aggregates per country and parameter."""
+    parts = {}
+    for row in data:
+        if row.get("country") not in GEO_BY_ISO2:
+            continue
+        key = (_cell(row["country"], row["month"][:4]), f"openaq_{row['parameter']}")
+        parts.setdefault(key, []).append(row)
+    out = {}
+    for (cell, feature), rows in parts.items():
+        agg = merge_aggregates(rows)
+        out.setdefault(cell, {})[feature] = agg
+    return out
+
+
+# --- input discovery ---
+
+def _list_objects(s3_client, bucket: str, prefix: str):
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        yield from page.get("Contents", [])
+
+
+def discover_inputs(s3_client, bucket: str) -> dict:
+    """
+    Pick the latest object per input slot (WHO indicator, Eurostat dataset, ECDC country-year, OpenAQ sensor).
+    Returns:
+        dict: {slot: {"key": ..., "etag": ...}}
+    """
+    latest = {}
+
+    def offer(slot, obj):
+        if slot not in latest or (obj["LastModified"], obj["Key"]) > (latest[slot]["LastModified"], latest[slot]["Key"]):
+            latest[slot] = obj
+
+    for prefix, source in ((WHO_PREFIX, "who"), (EUROSTAT_PREFIX, "eurostat")):
+        for obj in _list_objects(s3_client, bucket, prefix):
+            if "/" in obj["Key"][len(prefix):]:
+                continue
+            code = _object_name(obj["Key"]).rsplit("_", 1)[0]
+            offer(f"{source}:{code}", obj)
+
+    # ECDC national partitions: national/country=<ISO3>/year=<YYYY>/...
+    national_prefix = f"{ECDC_PREFIX}national/"
+    for obj in _list_objects(s3_client, bucket, national_prefix):
+        parts = dict(p.split("=", 1) for p in obj["Key"][len(national_prefix):].split("/")[:-1] if "=" in p)
+        if "country" in parts and "year" in parts:
+            offer(f"ecdc:{parts['country']}/{parts['year']}", obj)
+
+    monthly_prefix = f"{ROLLUP_PREFIX}monthly/"
+    for obj in _list_objects(s3_client, bucket, monthly_prefix):
+        rel = obj["Key"][len(monthly_prefix):]
+        offer(f"openaq:{rel.split('.json', 1)[0]}", obj)
+
+    return {slot: {"key": obj["Key"], "etag": obj["ETag"]} for slot, obj in latest.items()}
+
+
+def load_slot(s3_client, bucket: str, slot: str, key: str):
+    """Read a slot's input object (ECDC partitions and OpenAQ rollups are JSON lines)."""
+    if slot.startswith(("ecdc:", "openaq:")):
+        return get_json_lines(s3_client, bucket, key)
+    return get_json(s3_client, bucket, key)
+
+
+def extract_slot(slot: str, data) -> dict:
+    """Dispatch feature extraction by slot type."""
+    source, _, code = slot.partition(":")
+    if source == "who":
+        return extract_who(data)
+    if source == "eurostat":
+        return extract_eurostat(data, code)
+    if source == "ecdc":
+        return extract_ecdc(data)
+    if source == "openaq":
+        return extract_openaq(data)
+    return {}
+
+
+# --- OpenAQ sensor selection ---
+
+def _openaq_sensor(slot: str) -> str:
+    """"openaq:<country>/<city>/<param>/sensor=<id>" -> "<country>/<param>/<id>"."""
+    country, _, param, sensor = slot.partition(":")[2].split("/")
+    return f"{country}/{param}/{sensor.split('=', 1)[1]}"
+
+
+def load_openaq_selection(s3_client, bucket: str) -> set:
+    """Sensors currently selected per city and pollutant, as "<country>/<param>/<id>"."""
+    selection = get_json_if_exists(s3_client, bucket, stored_key(OPENAQ_SELECTION_KEY, INTERNAL_COMPRESSION),
+                                   default={"sensors": {}})
+    return {f"{s['iso']}/{s['parameter']}/{s['sensor_id']}" for s in selection["sensors"].values()}
+
+
+# --- build ---
+
+def build_row(cell: str, slots: dict, openaq_selected: set = frozenset()) -> dict:
+    """
+    Assemble one country-year row from the cached features of all slots.
+    OpenAQ features use only the selected sensor of each city (one slot per city and pollutant);
+    cities are weighted equally: mean of city means, coverage as hours per city.
+    """
+    iso2, year = cell.split("|")
+    row = {**GEO_BY_ISO2[iso2], "year": int(year)}
+    aggs = {}
+    for slot in sorted(slots):
+        if slot.startswith("openaq:") and _openaq_sensor(slot) not in openaq_selected:
+            continue
+        for name, value in slots[slot]["features"].get(cell, {}).items():
+            if isinstance(value, dict):
+                aggs.setdefault(name, []).append(value)
+            else:
+                row[name] = value
+    for name, parts in sorted(aggs.items()):
+        parts = [p for p in parts if p["count"]]
+        if not parts:
+            continue
+        row[f"{name}_mean"] = sum(p["sum"] / p["count"] for p in parts) / len(parts)
+        row[f"{name}_min"] = min(p["min"] for p in parts)
+        row[f"{name}_max"] = max(p["max"] for p in parts)
+        row[f"{name}_coverage_hours"] = sum(p["coverage_hours"] for p in parts) / len(parts)
+        row[f"{name}_cities"] = len(parts)
+    return row
+
+
+def build_country_year(s3_client, bucket: str, full_rebuild: bool = False) -> dict:
+    """
+    Incrementally build the gold country-year feature table.
+    Only slots whose latest object changed (by ETag) are read; only country-years whose
+    features changed are rebuilt, and only the year partitions containing them are rewritten.
+    Args:
+        s3_client: boto3 S3 client
+        bucket (str): Data lake bucket
+        full_rebuild (bool): Ignore the build state and re-read every input
+    Returns:
+        dict: Build summary
+    """
+    state_key = stored_key(BUILD_STATE_KEY, INTERNAL_COMPRESSION)
+    state = {"slots": {}} if full_rebuild else get_json_if_exists(s3_client, bucket, state_key, default={"slots": {}})
+    if state.get("slice_config") != SLICE_CONFIG:
+        # features cached under other WHO/Eurostat slices cannot be reused
+        full_rebuild = True
+        state = {"slots": {}, "slice_config": SLICE_CONFIG}
+    slots = state["slots"]
+    inputs = discover_inputs(s3_client, bucket)
+
+    changed_cells = set()
+    slots_read = []
+    for slot, info in sorted(inputs.items()):
+        old = slots.get(slot)
+        if old and old["etag"] == info["etag"]:
+            continue
+        features = extract_slot(slot, load_slot(s3_client, bucket, slot, info["key"]))
+        old_features = old["features"] if old else {}
+        changed_cells.update(c for c in set(features) | set(old_features)
+                             if features.get(c) != old_features.get(c))
+        slots[slot] = {**info, "features": features}
+        slots_read.append(slot)
+
+    for slot in set(slots) - set(inputs):
+        changed_cells.update(slots.pop(slot)["features"])
+
+    # a city's re-picked sensor swaps which rollups feed its country-years
+    openaq_selected = load_openaq_selection(s3_client, bucket)
+    flipped = openaq_selected ^ set(state.get("openaq_selected", []))
+    for slot, entry in slots.items():
+        if slot.startswith("openaq:") and _openaq_sensor(slot) in flipped:
+            changed_cells.update(entry["features"])
+    state["openaq_selected"] = sorted(openaq_selected)
+
+    by_year = {}
+    for cell in changed_cells:
+        iso2, year = cell.split("|")
+        by_year.setdefault(year, set()).add(iso2)
+
+    for year, countries in sorted(by_year.items()):
+        part_key = f"{COUNTRY_YEAR_PREFIX}year={year}/country_year.json"
+        rows = {} if full_rebuild else {
+            r["iso2"]: r for r in get_json_if_exists(s3_client, bucket, stored_key(part_key, INTERNAL_COMPRESSION), default=[], lines=True)
+        }
+        for iso2 in countries:
+            row = build_row(_cell(iso2, year), slots, openaq_selected)
+            if len(row) > len(GEO_BY_ISO2[iso2]) + 1:
+                rows[iso2] = row
+            else:
+                rows.pop(iso2, None)
+        put_json_lines(s3_client, bucket, part_key, [rows[k] for k in sorted(rows)], codec=INTERNAL_COMPRESSION)
+
+    if full_rebuild or not get_json_if_exists(s3_client, bucket, stored_key(DIM_COUNTRY_KEY, INTERNAL_COMPRESSION), lines=True):
+        put_json_lines(s3_client, bucket, DIM_COUNTRY_KEY, GEO_DIMENSION, codec=INTERNAL_COMPRESSION)
+    put_json(s3_client, bucket, BUILD_STATE_KEY, state, codec=INTERNAL_COMPRESSION)
+
+    return {
+        "slots_read": slots_read,
+        "country_years_rebuilt": len(changed_cells),
+        "years_written": sorted(by_year),
+    }
+
+
+def lambda_handler(event, context):
+    """
+    AWS Lambda handler.
+    Incrementally rebuilds the gold country-year feature table ({"full_rebuild": true} to force).
+    """
+    if not S3_BUCKET:
+        return {"statusCode": 500, "body": json.dumps({"error": "Missing S3_BUCKET in env"})}
+    summary = build_country_year(s3_client, S3_BUCKET, full_rebuild=bool((event or {}).get("full_rebuild")))
+    return {
+        "statusCode": 200,
+        "body": json.dumps({"message": "Gold country-year table built", **summary})
+    }
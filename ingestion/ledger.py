@@ -0,0 +1,146 @@
+import os
+import json
+import boto3
+from itertools import takewhile
+from datetime import datetime, timedelta, timezone
+
+try:
+    from ingestion.s3_utils import (pending_ledger_entries, put_json, put_json_lines, get_json_lines,
+                                    get_json_if_exists, stored_key, INTERNAL_COMPRESSION)
+except ImportError:  # flat Lambda package: helper sits next to this module
+    from s3_utils import (pending_ledger_entries, put_json, put_json_lines, get_json_lines,
+                          get_json_if_exists, stored_key, INTERNAL_COMPRESSION)
+
+# Ingestion ledger: append-only segments (one per writer run) + compacted columnar snapshot
+S3_BUCKET = os.environ.get("S3_BUCKET")
+LEDGER_PREFIX = os.environ.get("LEDGER_PREFIX", "ledger/")
+SEGMENTS_PREFIX = f"{LEDGER_PREFIX}segments/"
+SNAPSHOT_KEY = f"{LEDGER_PREFIX}snapshot/ledger.json"
+
+# Segment keys start with the writer's clock taken just before the PUT, so a concurrent writer's
+# later segment can become visible first. Consumers only read segments older than this lag.
+SEGMENT_TS_FORMAT = "%Y%m%dT%H%M%S%fZ"
+SETTLE_SECONDS = int(os.environ.get("LEDGER_SETTLE_SECONDS", "300"))
+
+# Snapshot columns (one array per column)
+LEDGER_COLUMNS = [
+    "key", "source", "dataset", "rows", "time_from", "time_to",
+    "bytes", "uncompressed_bytes", "sha256", "written_at", "request_id",
+]
+
+# AWS S3 client
+s3_client = boto3.client("s3")
+
+
+def reset_ledger():
+    """Drop entries left queued by a failed earlier invocation in a warm Lambda container."""
+    pending_ledger_entries.clear()
+
+
+def flush_ledger(s3_client, bucket: str, source: str, request_id: str):
+    """
+    Persist queued ledger entries as one segment object for this writer run.
+    Segment keys start with a UTC timestamp, so key order is write order.
+    Args:
+        s3_client: boto3 S3 client
+        bucket (str): Data lake bucket
+        source (str): Writer name (e.g. "who")
+        request_id (str): Lambda request ID
+    Returns:
+        str: Segment key, or None when nothing was written
+    """
+    if not pending_ledger_entries:
+        return None
+    ts = datetime.now(timezone.utc).strftime(SEGMENT_TS_FORMAT)
+    rows = [{**entry, "request_id": request_id} for entry in pending_ledger_entries]
+    key = put_json_lines(s3_client, bucket, f"{SEGMENTS_PREFIX}{ts}_{source}_{request_id}.jsonl", rows,
+                         codec=INTERNAL_COMPRESSION)
+    pending_ledger_entries.clear()
+    return key
+
+
+def list_segments(s3_client, bucket: str, cursor: str = None) -> list:
+    """List segment keys written after `cursor` (a segment key), oldest first."""
+    params = {"Bucket": bucket, "Prefix": SEGMENTS_PREFIX}
+    if cursor:
+        params["StartAfter"] = cursor
+    keys = []
+    for page in s3_client.get_paginator("list_objects_v2").paginate(**params):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
+    return keys
+
+
+def read_entries_since(s3_client, bucket: str, cursor: str = None, source: str = None,
+                       settle_seconds: int = None):
+    """
+    Read ledger entries appended after `cursor`; cost is O(new segments).
+    Segments younger than the settle lag are left for the next call (the cursor stops before them),
+    so a segment whose PUT finished late is not skipped.
+    Args:
+        cursor (str): Last segment key already processed (None = from the beginning)
+        source (str): Optional source filter
+        settle_seconds (int): Settle lag (defaults to SETTLE_SECONDS)
+    Returns:
+        tuple: (entries, new cursor)
+    """
+    settle = SETTLE_SECONDS if settle_seconds is None else settle_seconds
+    horizon = (datetime.now(timezone.utc) - timedelta(seconds=settle)).strftime(SEGMENT_TS_FORMAT)
+    entries = []
+    segments = list(takewhile(lambda key: key[len(SEGMENTS_PREFIX):].split("_", 1)[0] <= horizon,
+                              list_segments(s3_client, bucket, cursor)))
+    for key in segments:
+        entries.extend(e for e in get_json_lines(s3_client, bucket, key)
+                       if source is None or e.get("source") == source)
+    return entries, (segments[-1] if segments else cursor)
+
+
+def load_snapshot(s3_client, bucket: str) -> dict:
+    """Load the compacted snapshot ({"watermark", "rows", "columns"}) or an empty one."""
+    return get_json_if_exists(s3_client, bucket, stored_key(SNAPSHOT_KEY, INTERNAL_COMPRESSION), default={
+        "watermark": None, "rows": 0, "columns": {c: [] for c in LEDGER_COLUMNS},
+    })
+
+
+def snapshot_rows(snapshot: dict) -> list:
+    """Turn a columnar snapshot back into row dicts."""
+    columns = snapshot["columns"]
+    return [{c: columns[c][i] for c in LEDGER_COLUMNS} for i in range(snapshot["rows"])]
+
+
+def compact_ledger(s3_client, bucket: str) -> dict:
+    """
+    Fold segments written since the snapshot watermark into the columnar snapshot.
+    The snapshot holds the latest entry per object key (rewritten keys replace older entries).
+    Returns:
+        dict: Compaction summary
+    """
+    snapshot = load_snapshot(s3_client, bucket)
+    entries, watermark = read_entries_since(s3_client, bucket, snapshot["watermark"])
+    if not entries:
+        return {"new_entries": 0, "rows": snapshot["rows"], "watermark": snapshot["watermark"]}
+
+    by_key = {row["key"]: row for row in snapshot_rows(snapshot)}
+    for entry in entries:
+        by_key[entry["key"]] = entry
+    rows = sorted(by_key.values(), key=lambda r: (r.get("written_at") or "", r["key"]))
+
+    put_json(s3_client, bucket, SNAPSHOT_KEY, {
+        "watermark": watermark,
+        "rows": len(rows),
+        "columns": {c: [r.get(c) for r in rows] for c in LEDGER_COLUMNS},
+    }, codec=INTERNAL_COMPRESSION)
+    return {"new_entries": len(entries), "rows": len(rows), "watermark": watermark}
+
+
+def lambda_handler(event, context):
+    """
+    AWS Lambda handler.
+    Compacts new ledger segments into the columnar snapshot (run periodically).
+    """
+    if not S3_BUCKET:
+        return {"statusCode": 500, "body": json.dumps({"error": "Missing S3_BUCKET in env"})}
+    summary = compact_ledger(s3_client, S3_BUCKET)
+    return {
+        "statusCode": 200,
+        "body": json.dumps({"message": "Ingestion ledger compacted", **summary})
+    }
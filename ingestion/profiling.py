@@ -0,0 +1,162 @@
+import io
+import os
+import time
+import marshal
+import pstats
+import cProfile
+import tracemalloc
+from botocore.exceptions import BotoCoreError, ClientError
+
+# Profiling is opt-in: event {"profile": true} or PROFILE_HANDLER=1 in Lambda env vars
+PROFILE_ENV_VAR = "PROFILE_HANDLER"
+PROFILE_PREFIX = os.environ.get("PROFILE_PREFIX", "profiles/")
+
+# Size of the text summary sections
+TOP_FUNCTIONS = 30
+TOP_ALLOCATORS = 15
+TRACEMALLOC_FRAMES = 5
+
+# High-water checkpoint of the profiled run (None when no run is being profiled)
+_high_water = None
+
+
+def checkpoint():
+    """
+    Mark a point where the handler holds its working set (e.g. after a page or partition is stored).
+    While profiling, a snapshot is kept whenever traced memory exceeds the previous checkpoints.
+    A no-op when profiling is off.
+    """
+    if _high_water is None or not tracemalloc.is_tracing():
+        return
+    current, _ = tracemalloc.get_traced_memory()
+    if current > _high_water["bytes"]:
+        _high_water["bytes"] = current
+        _high_water["snapshot"] = tracemalloc.take_snapshot()
+
+
+def profiling_enabled(event) -> bool:
+    """Check the event flag first, then the environment variable."""
+    if isinstance(event, dict) and event.get("profile"):
+        return True
+    return os.environ.get(PROFILE_ENV_VAR, "").lower() in ("1", "true", "yes")
+
+
+def _write_diff(out, title: str, snapshot, baseline):
+    out.write(f"== {title} ==\n")
+    for stat in snapshot.compare_to(baseline, "lineno")[:TOP_ALLOCATORS]:
+        out.write(f"{stat.size_diff / 1024:+10.1f} KiB  {stat.count_diff:+8d} blocks  {stat.traceback}\n")
+
+
+def build_summary(source: str, profiler: cProfile.Profile, baseline, snapshot, peak_bytes: int,
+                  wall_seconds: float, high_water: dict = None) -> str:
+    """
+    Render a short human-readable profile summary.
+    Args:
+        source (str): Data source name (e.g. "openaq")
+        profiler (cProfile.Profile): Finished profiler
+        baseline (tracemalloc.Snapshot): Memory snapshot taken before the handler ran
+        snapshot (tracemalloc.Snapshot): Memory snapshot taken at the end of the run
+        peak_bytes (int): Peak traced memory
+        wall_seconds (float): Handler wall time
+        high_water (dict): {"bytes", "snapshot"} of the highest checkpoint, if any
+    Returns:
+        str: Summary text
+    """
+    out = io.StringIO()
+    out.write(f"source: {source}\n")
+    out.write(f"wall time: {wall_seconds:.3f} s\n")
+    out.write(f"peak traced memory: {peak_bytes / 1024 / 1024:.2f} MiB\n")
+    if high_water and high_water.get("snapshot"):
+        out.write(f"high-water checkpoint: {high_water['bytes'] / 1024 / 1024:.2f} MiB traced\n")
+    out.write("\n")
+
+    out.write(f"== top {TOP_FUNCTIONS} functions by cumulative time ==\n")
+    stats = pstats.Stats(profiler, stream=out)
+    stats.strip_dirs().sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+
+    if high_water and high_water.get("snapshot"):
+        _write_diff(out, f"top {TOP_ALLOCATORS} allocators at high-water checkpoint (vs. before handler)",
+                    high_water["snapshot"], baseline)
+    else:
+        out.write("== no high-water checkpoint reached ==\n")
+    _write_diff(out, f"top {TOP_ALLOCATORS} allocators still live at end of run (vs. before handler)",
+                snapshot, baseline)
+    return out.getvalue()
+
+
+def upload_profile(s3_client, bucket: str, source: str, request_id: str,
+                   profiler: cProfile.Profile, summary: str) -> dict:
+    """
+    Upload the raw cProfile stats (pstats-compatible) and the summary to S3.
+    Returns:
+        dict: Keys of the uploaded objects
+    """
+    base = f"{PROFILE_PREFIX}{source}/{request_id}"
+    profiler.create_stats()
+    keys = {"stats": f"{base}.prof", "summary": f"{base}.txt"}
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=keys["stats"],
+        Body=marshal.dumps(profiler.stats),
+        ContentType="application/octet-stream",
+    )
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=keys["summary"],
+        Body=summary.encode("utf-8"),
+        ContentType="text/plain; charset=utf-8",
+    )
+    return keys
+
+
+def run_with_profiling(handler, event, context, s3_client, bucket: str, source: str):
+    """
+    Run a Lambda handler, optionally under cProfile and tracemalloc.
+    When profiling is off the handler is called directly.
+    Args:
+        handler (callable): Function taking (event, context)
+        event: Lambda event
+        context: Lambda context
+        s3_client: boto3 S3 client used for the profile upload
+        bucket (str): Target bucket
+        source (str): Data source name used in the profile key
+    Returns:
+        Handler response (with "profile_keys" added when profiling ran)
+    """
+    if not profiling_enabled(event):
+        return handler(event, context)
+
+    global _high_water
+    request_id = context.aws_request_id if context else "local"
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    baseline = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    _high_water = {"bytes": tracemalloc.get_traced_memory()[0], "snapshot": None}
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+
+    profiler.enable()
+    try:
+        response = handler(event, context)
+    finally:
+        profiler.disable()
+        wall_seconds = time.perf_counter() - start
+        snapshot = tracemalloc.take_snapshot()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        high_water, _high_water = _high_water, None
+        if not already_tracing:
+            tracemalloc.stop()
+
+        summary = build_summary(source, profiler, baseline, snapshot, peak_bytes, wall_seconds, high_water)
+        try:
+            keys = upload_profile(s3_client, bucket, source, request_id, profiler, summary)
+        except (BotoCoreError, ClientError) as e:
+            # Profiling is diagnostic only: never fail the ingestion run because of it
+            print(f"WARN: failed to upload profile to S3: {e}")
+            keys = None
+
+    if isinstance(response, dict) and keys:
+        response["profile_keys"] = keys
+    return response
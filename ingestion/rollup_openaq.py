@@ -0,0 +1,214 @@
+import os
+import re
+import json
+import math
+import calendar
+import operator
+import boto3
+
+try:
+    from ingestion.s3_utils import put_json, put_json_lines, get_json, get_json_if_exists, stored_key, INTERNAL_COMPRESSION
+    from ingestion.ledger import read_entries_since
+except ImportError:  # flat Lambda package: helpers sit next to this module
+    from s3_utils import put_json, put_json_lines, get_json, get_json_if_exists, stored_key, INTERNAL_COMPRESSION
+    from ledger import read_entries_since
+
+# Rollups of OpenAQ hourly measurements (daily and monthly grain)
+S3_BUCKET = os.environ.get("S3_BUCKET")
+S3_PREFIX = os.environ.get("S3_PREFIX", "bronze/openaq/v3/eu27/")
+ROLLUP_PREFIX = os.environ.get("ROLLUP_PREFIX", "gold/openaq/rollups/")
+
+# Bronze page key: {S3_PREFIX}{country}/{city_slug}/{param}/sensor={id}/page=...
+PAGE_KEY_RE = re.compile(r"([A-Z]{2})/([^/]+)/([^/]+)/sensor=(\d+)/page=[^/]+$")
+
+# AWS S3 client
+s3_client = boto3.client("s3")
+
+
+# --- mergeable aggregates ---
+
+def aggregate(values: list) -> dict:
+    """
+    Build a mergeable aggregate from a batch of hourly values.
+    Args:
+        values (list): Hourly values (one per observed hour)
+    Returns:
+        dict: count, sum, sum_sq, min, max, coverage_hours
+    """
+    if not values:
+        return {"count": 0, "sum": 0.0, "sum_sq": 0.0, "min": None, "max": None, "coverage_hours": 0}
+    return {
+        "count": len(values),
+        "sum": math.fsum(values),
+        "sum_sq": math.fsum(map(operator.mul, values, values)),
+        "min": min(values),
+        "max": max(values),
+        "coverage_hours": len(values),
+    }
+
+
+def merge_aggregates(aggs) -> dict:
+    """Merge aggregates of disjoint time ranges (e.g. days into a month)."""
+    aggs = [a for a in aggs if a and a.get("count")]
+    if not aggs:
+        return aggregate([])
+    return {
+        "count": sum(a["count"] for a in aggs),
+        "sum": math.fsum(a["sum"] for a in aggs),
+        "sum_sq": math.fsum(a["sum_sq"] for a in aggs),
+        "min": min(a["min"] for a in aggs),
+        "max": max(a["max"] for a in aggs),
+        "coverage_hours": sum(a["coverage_hours"] for a in aggs),
+    }
+
+
+def with_stats(agg: dict, expected_hours: int) -> dict:
+    """Add derived mean/std/coverage_pct to an aggregate (for readers, not for merging)."""
+    out = dict(agg)
+    n = agg["count"]
+    out["mean"] = agg["sum"] / n if n else None
+    out["std"] = math.sqrt(max(agg["sum_sq"] / n - out["mean"] ** 2, 0.0)) if n else None
+    out["expected_hours"] = expected_hours
+    out["coverage_pct"] = round(100.0 * agg["coverage_hours"] / expected_hours, 2) if expected_hours else None
+    return out
+
+
+# --- hourly input ---
+
+def extract_hourly_values(page: dict) -> dict:
+    """
+    Extract hourly values from an OpenAQ /measurements/hourly page.
+    Returns:
+        dict: {"YYYY-MM-DDTHH": value} (UTC hour of period start)
+    """
+    hours = {}
+    for rec in page.get("results", []):
+        value = rec.get("value")
+        start = (((rec.get("period") or {}).get("datetimeFrom") or {}).get("utc")) or ""
+        if value is None or len(start) < 13:
+            continue
+        hours[start[:13]] = float(value)
+    return hours
+
+
+def _group_by_month(hourly: dict) -> dict:
+    by_month = {}
+    for hour, value in hourly.items():
+        by_month.setdefault(hour[:7], {})[hour] = value
+    return by_month
+
+
+def _daily_rows(hours: dict) -> dict:
+    """Aggregate one month of hours into {date: aggregate}."""
+    by_day = {}
+    for hour, value in hours.items():
+        by_day.setdefault(hour[:10], []).append(value)
+    return {day: aggregate(values) for day, values in sorted(by_day.items())}
+
+
+# --- S3 partitions ---
+
+def _sensor_path(country: str, city_slug: str, param_name: str, sensor_id) -> str:
+    return f"{country}/{city_slug}/{param_name}/sensor={sensor_id}"
+
+
+def update_sensor_rollups(s3_client, bucket: str, country: str, city_slug: str, param_name: str,
+                          sensor_id, hourly: dict) -> list:
+    """
+    Merge newly ingested hours into the daily/monthly rollups of one sensor.
+    Only months touched by `hourly` are read; only months whose hours changed are rewritten.
+    Hour-level state per month keeps repeated ingestion of the same hours idempotent.
+    Args:
+        s3_client: boto3 S3 client
+        bucket (str): Target bucket
+        country (str): ISO2 country code
+        city_slug (str): Normalized city name used in bronze keys
+        param_name (str): Pollutant name (e.g. "pm25")
+        sensor_id: OpenAQ sensor ID
+        hourly (dict): {"YYYY-MM-DDTHH": value}
+    Returns:
+        list: Months ("YYYY-MM") whose rollups were rewritten
+    """
+    path = _sensor_path(country, city_slug, param_name, sensor_id)
+    ids = {"country": country, "city": city_slug, "parameter": param_name, "sensor_id": int(sensor_id)}
+    changed = {}
+
+    for month, new_hours in sorted(_group_by_month(hourly).items()):
+        state_key = f"{ROLLUP_PREFIX}_state/{path}/month={month}.json"
+        state = get_json_if_exists(s3_client, bucket, stored_key(state_key, INTERNAL_COMPRESSION), default={"hours": {}})
+        merged = {**state["hours"], **new_hours}
+        if merged == state["hours"]:
+            continue
+
+        days = _daily_rows(merged)
+        put_json(s3_client, bucket, state_key, {"hours": merged}, codec=INTERNAL_COMPRESSION)
+        put_json_lines(s3_client, bucket, f"{ROLLUP_PREFIX}daily/{path}/month={month}.json", [
+            {**ids, "date": day, **with_stats(agg, 24)} for day, agg in days.items()
+        ], codec=INTERNAL_COMPRESSION)
+        year, mon = int(month[:4]), int(month[5:7])
+        changed[month] = with_stats(merge_aggregates(days.values()), 24 * calendar.monthrange(year, mon)[1])
+
+    if changed:
+        monthly_key = f"{ROLLUP_PREFIX}monthly/{path}.json"
+        months = {row["month"]: row for row in get_json_if_exists(
+            s3_client, bucket, stored_key(monthly_key, INTERNAL_COMPRESSION), default=[], lines=True)}
+        months.update({m: {**ids, "month": m, **agg} for m, agg in changed.items()})
+        put_json_lines(s3_client, bucket, monthly_key, [months[m] for m in sorted(months)],
+                       codec=INTERNAL_COMPRESSION)
+
+    return sorted(changed)
+
+
+def rollup_from_keys(s3_client, bucket: str, keys: list) -> dict:
+    """
+    Rebuild rollups from already stored bronze hourly pages (backfill / reprocessing).
+    Pages are grouped per sensor so each sensor is updated in one batch.
+    Returns:
+        dict: {"<country>/<city>/<param>/sensor=<id>": [months rewritten]}
+    """
+    batches = {}
+    for key in keys:
+        match = PAGE_KEY_RE.search(key)
+        if not match:
+            continue
+        hours = extract_hourly_values(get_json(s3_client, bucket, key))
+        batches.setdefault(match.groups(), {}).update(hours)
+
+    result = {}
+    for (country, city_slug, param_name, sensor_id), hourly in batches.items():
+        months = update_sensor_rollups(s3_client, bucket, country, city_slug, param_name, sensor_id, hourly)
+        result[_sensor_path(country, city_slug, param_name, sensor_id)] = months
+    return result
+
+
+def rollup_from_ledger(s3_client, bucket: str) -> dict:
+    """
+    Roll up OpenAQ pages recorded in the ingestion ledger since the last processed segment.
+    The ledger cursor is kept next to the rollup state, so no bronze listing is needed.
+    """
+    cursor_key = f"{ROLLUP_PREFIX}_state/ledger_cursor.json"
+    cursor = get_json_if_exists(s3_client, bucket, stored_key(cursor_key, INTERNAL_COMPRESSION), default={}).get("cursor")
+    entries, new_cursor = read_entries_since(s3_client, bucket, cursor, source="openaq")
+    updated = rollup_from_keys(s3_client, bucket, [e["key"] for e in entries])
+    if new_cursor != cursor:
+        put_json(s3_client, bucket, cursor_key, {"cursor": new_cursor}, codec=INTERNAL_COMPRESSION)
+    return updated
+
+
+def lambda_handler(event, context):
+    """
+    AWS Lambda handler.
+    Rebuilds OpenAQ rollups for the bronze hourly page keys given in event["keys"],
+    or for pages appended to the ingestion ledger since the last run when no keys are given.
+    """
+    if not S3_BUCKET:
+        return {"statusCode": 500, "body": json.dumps({"error": "Missing S3_BUCKET in env"})}
+    keys = (event or {}).get("keys")
+    if keys is None:
+        updated = rollup_from_ledger(s3_client, S3_BUCKET)
+    else:
+        updated = rollup_from_keys(s3_client, S3_BUCKET, keys)
+    return {
+        "statusCode": 200,
+        "body": json.dumps({"message": "OpenAQ rollups updated", "updated": updated})
+    }
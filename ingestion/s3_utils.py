@@ -0,0 +1,194 @@
+import os
+import gzip
+import json
+import hashlib
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed when BRONZE_COMPRESSION=zstd
+    zstandard = None
+
+# Compression for bronze writes (set via Terraform / Lambda env vars).
+# gzip is the default because Athena reads *.gz objects natively.
+BRONZE_COMPRESSION = os.environ.get("BRONZE_COMPRESSION", "gzip")
+BRONZE_COMPRESSION_LEVEL = os.environ.get("BRONZE_COMPRESSION_LEVEL")
+
+# Fixed codec for internal state, ledger and gold objects. Not configurable: incremental
+# state is looked up by key, so changing the codec would orphan it and leave
+# duplicate .gz/.zst objects for Athena.
+INTERNAL_COMPRESSION = "gzip"
+
+# Ledger entries of bronze writes not yet persisted (see ledger.flush_ledger)
+pending_ledger_entries = []
+
+# codec -> (object key extension, Content-Encoding header, default level)
+CODECS = {
+    "none": ("", None, None),
+    "gzip": (".gz", "gzip", 6),
+    "zstd": (".zst", "zstd", 3),
+}
+
+# Fail at import (cold start) rather than part-way through a run on a bad codec setting
+if BRONZE_COMPRESSION.lower() not in CODECS:
+    raise ValueError(f"Unsupported BRONZE_COMPRESSION: {BRONZE_COMPRESSION}")
+if BRONZE_COMPRESSION.lower() == "zstd" and zstandard is None:
+    raise RuntimeError("BRONZE_COMPRESSION=zstd requires the 'zstandard' package in the Lambda bundle.")
+
+
+def compress_bytes(raw: bytes, codec: str = None, level: int = None):
+    """
+    Compress a byte payload with the selected codec.
+    Args:
+        raw (bytes): Uncompressed payload
+        codec (str): One of CODECS (defaults to BRONZE_COMPRESSION)
+        level (int): Compression level (BRONZE_COMPRESSION_LEVEL for the bronze codec, else codec default)
+    Returns:
+        tuple: (compressed bytes, key extension, Content-Encoding or None, level used)
+    """
+    codec = (codec or BRONZE_COMPRESSION).lower()
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported compression codec: {codec}")
+    ext, encoding, default_level = CODECS[codec]
+    if level is None and BRONZE_COMPRESSION_LEVEL and codec == BRONZE_COMPRESSION.lower():
+        level = int(BRONZE_COMPRESSION_LEVEL)
+    if level is None:
+        level = default_level
+
+    if codec == "gzip":
+        # mtime=0 keeps output deterministic for identical payloads
+        body = gzip.compress(raw, compresslevel=level, mtime=0)
+    elif codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd compression requested but 'zstandard' is not installed.")
+        body = zstandard.ZstdCompressor(level=level).compress(raw)
+    else:
+        body = raw
+    return body, ext, encoding, level
+
+
+def decompress_bytes(body: bytes, codec: str) -> bytes:
+    """Reverse compress_bytes for the given codec."""
+    codec = codec.lower()
+    if codec == "gzip":
+        return gzip.decompress(body)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd decompression requested but 'zstandard' is not installed.")
+        return zstandard.ZstdDecompressor().decompress(body)
+    return body
+
+
+def codec_for_key(key: str) -> str:
+    """Infer the codec of a stored object from its key extension."""
+    for codec, (ext, _, _) in CODECS.items():
+        if ext and key.endswith(ext):
+            return codec
+    return "none"
+
+
+def put_bytes(s3_client, bucket: str, key: str, raw: bytes, content_type: str,
+              codec: str = None, level: int = None, ledger: dict = None) -> str:
+    """
+    Compress an already serialized payload and upload it to S3.
+    The codec extension is appended to the key and recorded in object metadata.
+    Args:
+        s3_client: boto3 S3 client
+        bucket (str): Target bucket
+        key (str): Target key of the uncompressed object (e.g. "...json")
+        raw (bytes): Serialized payload
+        content_type (str): Content-Type of the uncompressed payload
+        codec (str): Compression codec (defaults to BRONZE_COMPRESSION)
+        level (int): Compression level
+        ledger (dict): Ledger fields (source, dataset, rows, time_from, time_to); when given,
+            an entry with key, size and checksum is queued in pending_ledger_entries
+    Returns:
+        str: Final S3 key (including the codec extension)
+    """
+    body, ext, encoding, used_level = compress_bytes(raw, codec, level)
+    final_key = f"{key}{ext}"
+
+    params = {
+        "Bucket": bucket,
+        "Key": final_key,
+        "Body": body,
+        "ContentType": content_type,
+        "Metadata": {
+            "compression": (codec or BRONZE_COMPRESSION).lower(),
+            "compression-level": str(used_level) if used_level is not None else "",
+            "uncompressed-bytes": str(len(raw)),
+        },
+    }
+    if encoding:
+        params["ContentEncoding"] = encoding
+    s3_client.put_object(**params)
+
+    if ledger is not None:
+        pending_ledger_entries.append({
+            **ledger,
+            "key": final_key,
+            "bytes": len(body),
+            "uncompressed_bytes": len(raw),
+            "sha256": hashlib.sha256(body).hexdigest(),
+            "written_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        })
+    return final_key
+
+
+def put_json(s3_client, bucket: str, key: str, obj, codec: str = None, level: int = None,
+             ledger: dict = None) -> str:
+    """
+    Serialize an object to JSON, compress it and upload it to S3 (see put_bytes).
+    Returns:
+        str: Final S3 key (including the codec extension)
+    """
+    raw = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    return put_bytes(s3_client, bucket, key, raw, "application/json", codec, level, ledger)
+
+
+def put_json_lines(s3_client, bucket: str, key: str, rows, codec: str = None, level: int = None,
+                   ledger: dict = None) -> str:
+    """
+    Serialize rows as newline-delimited JSON (Athena/Glue JSON SerDe), compress and upload.
+    Returns:
+        str: Final S3 key (including the codec extension)
+    """
+    raw = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+    return put_bytes(s3_client, bucket, key, raw, "application/x-ndjson", codec, level, ledger)
+
+
+def get_json(s3_client, bucket: str, key: str):
+    """Download an object written by put_json and decode it."""
+    body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+    return json.loads(decompress_bytes(body, codec_for_key(key)).decode("utf-8"))
+
+
+def get_json_lines(s3_client, bucket: str, key: str) -> list:
+    """Download an object written by put_json_lines and decode its rows."""
+    body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+    text = decompress_bytes(body, codec_for_key(key)).decode("utf-8")
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def stored_key(key: str, codec: str = None) -> str:
+    """Key under which put_json stores `key` with the given (or default) codec."""
+    codec = (codec or BRONZE_COMPRESSION).lower()
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported compression codec: {codec}")
+    return f"{key}{CODECS[codec][0]}"
+
+
+def get_json_if_exists(s3_client, bucket: str, key: str, default=None, lines: bool = False):
+    """
+    Like get_json (or get_json_lines when `lines`), but return `default` when the object does not exist.
+    `key` is the final stored key (see stored_key).
+    """
+    try:
+        if lines:
+            return get_json_lines(s3_client, bucket, key)
+        return get_json(s3_client, bucket, key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return default
+        raise
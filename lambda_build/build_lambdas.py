@@ -0,0 +1,107 @@
+"""
+Build the Lambda deployment bundles lambda_build/<name>/<name>.zip.
+
+Lambdas are packaged flat (no ingestion/ package): each bundle holds its handler module,
+the shared helper modules next to it and the pinned third-party dependencies.
+
+Usage:
+    python lambda_build/build_lambdas.py            # all bundles
+    python lambda_build/build_lambdas.py openaq     # selected bundles
+"""
+import os
+import sys
+import shutil
+import zipfile
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INGESTION_DIR = os.path.join(ROOT, "ingestion")
+BUILD_DIR = os.path.join(ROOT, "lambda_build")
+REQUIREMENTS = os.path.join(BUILD_DIR, "requirements-lambda.txt")
+
+# Bundle name -> handler module (Lambda handler: <module>.lambda_handler)
+BUNDLES = {
+    "ecdc": "download_ecdc.py",
+    "eurostat": "download_eurostat.py",
+    "openaq": "download_openaq.py",
+    "who": "download_who.py",
+    # maintenance handlers (scheduled in terraform/eventbridge.tf)
+    "ledger": "ledger.py",
+    "rollup_openaq": "rollup_openaq.py",
+    "gold_country_year": "gold_country_year.py",
+}
+
+# Helper modules imported by the handlers (flat Lambda package fallback imports)
+SHARED_MODULES = ["s3_utils.py", "profiling.py", "ledger.py", "rollup_openaq.py"]
+
+# Target platform of the Lambda runtime (python3.11, x86_64)
+PIP_PLATFORM_ARGS = [
+    "--platform", "manylinux2014_x86_64",
+    "--implementation", "cp",
+    "--python-version", "3.11",
+    "--only-binary=:all:",
+]
+
+# Fixed timestamp for zip entries, so unchanged sources give identical bundles
+ZIP_DATE = (2025, 1, 1, 0, 0, 0)
+
+
+def install_dependencies(target: str):
+    """Install the pinned Lambda dependencies for the Lambda platform into `target`."""
+    subprocess.run(
+        [sys.executable, "-m", "pip", "install", "--quiet", "--target", target,
+         "-r", REQUIREMENTS, *PIP_PLATFORM_ARGS],
+        check=True,
+    )
+
+
+def _zip_files(deps_dir: str, handler: str):
+    """Yield (archive name, source path) pairs of one bundle, sorted."""
+    files = {}
+    for base, dirs, names in os.walk(deps_dir):
+        dirs[:] = [d for d in dirs if d != "__pycache__"]
+        for name in names:
+            if name.endswith(".pyc"):
+                continue
+            path = os.path.join(base, name)
+            files[os.path.relpath(path, deps_dir).replace(os.sep, "/")] = path
+    for module in [handler] + SHARED_MODULES:
+        files[module] = os.path.join(INGESTION_DIR, module)
+    return sorted(files.items())
+
+
+def build_bundle(name: str, deps_dir: str) -> str:
+    """
+    Write lambda_build/<name>/<name>.zip.
+    Returns:
+        str: Path of the bundle
+    """
+    out_dir = os.path.join(BUILD_DIR, name)
+    os.makedirs(out_dir, exist_ok=True)
+    out_path = os.path.join(out_dir, f"{name}.zip")
+    with zipfile.ZipFile(out_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for arcname, path in _zip_files(deps_dir, BUNDLES[name]):
+            info = zipfile.ZipInfo(arcname, date_time=ZIP_DATE)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            with open(path, "rb") as fh:
+                zf.writestr(info, fh.read())
+    return out_path
+
+
+def main(names):
+    unknown = set(names) - set(BUNDLES)
+    if unknown:
+        raise SystemExit(f"Unknown bundle(s): {', '.join(sorted(unknown))}")
+    deps_dir = tempfile.mkdtemp(prefix="lambda_deps_")
+    try:
+        install_dependencies(deps_dir)
+        for name in names or sorted(BUNDLES):
+            print(build_bundle(name, deps_dir))
+    finally:
+        shutil.rmtree(deps_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
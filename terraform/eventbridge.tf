@@ -49,3 +49,50 @@ resource "aws_cloudwatch_event_target" "ecdc_target" {
   arn       = aws_sfn_state_machine.orchestration.arn
   role_arn  = aws_iam_role.eventbridge_invoke_stepfn_role.arn
 }
+
+# OpenAQ hourly latest readings (invokes the OpenAQ Lambda directly, outside the orchestration)
+resource "aws_cloudwatch_event_rule" "openaq_latest_schedule" {
+  name                = "openaq-latest-hourly"
+  schedule_expression = "rate(1 hour)"
+}
+
+resource "aws_cloudwatch_event_target" "openaq_latest_target" {
+  rule      = aws_cloudwatch_event_rule.openaq_latest_schedule.name
+  target_id = "OpenAQLatestTarget"
+  arn       = aws_lambda_function.api_ingestion["openaq"].arn
+  input     = jsonencode({ mode = "latest" })
+}
+
+resource "aws_lambda_permission" "openaq_latest_eventbridge" {
+  statement_id  = "AllowEventBridgeOpenAQLatest"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.api_ingestion["openaq"].function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.openaq_latest_schedule.arn
+}
+
+# Maintenance Lambdas (see local.maintenance_functions in lambda.tf)
+resource "aws_cloudwatch_event_rule" "maintenance_schedule" {
+  for_each = local.maintenance_functions
+
+  name                = "${replace(each.key, "_", "-")}-schedule"
+  schedule_expression = each.value.schedule
+}
+
+resource "aws_cloudwatch_event_target" "maintenance_target" {
+  for_each = local.maintenance_functions
+
+  rule      = aws_cloudwatch_event_rule.maintenance_schedule[each.key].name
+  target_id = "Maintenance-${each.key}"
+  arn       = aws_lambda_function.maintenance[each.key].arn
+}
+
+resource "aws_lambda_permission" "maintenance_eventbridge" {
+  for_each = local.maintenance_functions
+
+  statement_id  = "AllowEventBridge-${each.key}"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.maintenance[each.key].function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.maintenance_schedule[each.key].arn
+}
@@ -25,3 +25,48 @@ resource "aws_lambda_function" "api_ingestion" {
 
   tags = var.default_tags
 }
+
+# Maintenance Lambdas working on the data lake. Bundles are built by lambda_build/build_lambdas.py
+# and uploaded to lambda/<name>.zip by the Deploy Lambdas workflow; schedules in eventbridge.tf.
+locals {
+  maintenance_functions = {
+    ledger = {
+      handler  = "ledger.lambda_handler"
+      schedule = "cron(0 2 * * ? *)" # daily ledger compaction
+      timeout  = 300
+    }
+    rollup_openaq = {
+      handler  = "rollup_openaq.lambda_handler"
+      schedule = "cron(20 * * * ? *)" # hourly, picks up pages the OpenAQ Lambda could not roll up
+      timeout  = 900
+    }
+    gold_country_year = {
+      handler  = "gold_country_year.lambda_handler"
+      schedule = "cron(0 3 * * ? *)" # daily, after ledger compaction; unchanged inputs are skipped
+      timeout  = 900
+    }
+  }
+}
+
+resource "aws_lambda_function" "maintenance" {
+  for_each = local.maintenance_functions
+
+  function_name = "project2-${replace(each.key, "_", "-")}-lambda"
+  role          = aws_iam_role.lambda_role.arn
+  runtime       = "python3.11"
+  handler       = each.value.handler
+
+  s3_bucket = coalesce(var.lambda_code_bucket, var.s3_bucket_name)
+  s3_key    = "lambda/${each.key}.zip"
+
+  timeout     = each.value.timeout
+  memory_size = 512
+
+  environment {
+    variables = {
+      S3_BUCKET = var.s3_bucket_name
+    }
+  }
+
+  tags = var.default_tags
+}
@@ -24,3 +24,27 @@ resource "aws_s3_bucket_versioning" "data_lake_versioning" {
   }
 }
 
+
+# Expire the OpenAQ hourly "latest" hot partition (24 objects per day)
+resource "aws_s3_bucket_lifecycle_configuration" "data_lake_lifecycle" {
+  bucket = aws_s3_bucket.data_lake.id
+
+  rule {
+    id     = "expire-openaq-latest"
+    status = "Enabled"
+
+    filter {
+      prefix = "bronze/openaq/latest/"
+    }
+
+    expiration {
+      days = var.openaq_latest_retention_days
+    }
+
+    noncurrent_version_expiration {
+      noncurrent_days = 1
+    }
+  }
+
+  depends_on = [aws_s3_bucket_versioning.data_lake_versioning]
+}
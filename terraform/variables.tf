@@ -36,3 +36,15 @@ variable "openaq_api_key" {
   type        = string
   sensitive   = true
 }
+
+variable "openaq_latest_retention_days" {
+  description = "Days to keep objects in the OpenAQ hourly latest-readings hot partition"
+  type        = number
+  default     = 7
+}
+
+variable "lambda_code_bucket" {
+  description = "Bucket holding the uploaded Lambda bundles (lambda/<name>.zip); defaults to the data lake bucket"
+  type        = string
+  default     = null
+}
@@ -1,4 +1,5 @@
 import os
+import gzip
 import json
 import boto3
 import pytest
@@ -25,20 +26,32 @@ def s3_client_mock():
         yield s3
 
 
-def test_fetch_ecdc_covid_data(requests_mock):
-    """Test that data is fetched correctly from the ECDC API."""
-    mock_data = [{"country": "Poland", "cases": 100, "deaths": 5}]
+def test_iter_ecdc_records_streams_api_response(requests_mock):
+    """Records are streamed from the ECDC API one by one."""
+    mock_data = [{"country_code": "POL", "year_week": "2020-10", "weekly_count": 100}]
     requests_mock.get(download_ecdc.ECDC_COVID_URL, json=mock_data, status_code=200)
 
-    result = download_ecdc.fetch_ecdc_covid_data()
-    assert result == mock_data
-    assert isinstance(result, list)
+    assert list(download_ecdc.iter_ecdc_records()) == mock_data
 
 
-def test_save_to_s3_and_lambda_handler(aws_env, s3_client_mock, requests_mock):
-    """Test the full Lambda handler flow: fetch → save → return."""
+def test_iter_json_array_handles_chunk_boundaries():
+    """Stream parser yields the same records regardless of chunk size."""
+    data = [{"country_code": "POL", "weekly_count": i, "note": "zażółć"} for i in range(50)] + [1, 2.5, None]
+    raw = json.dumps(data).encode("utf-8")
+    for size in (1, 3, 64, len(raw)):
+        chunks = (raw[i:i + size] for i in range(0, len(raw), size))
+        assert list(download_ecdc.iter_json_array(chunks)) == data
+
+
+def test_lambda_handler_partitions_eu27_by_country_and_year(aws_env, s3_client_mock, requests_mock):
+    """Test the full Lambda handler flow: stream → filter EU27 → partition → save."""
     # Mock API response
-    mock_data = [{"country": "Germany", "cases": 200, "deaths": 10}]
+    mock_data = [
+        {"country_code": "DEU", "indicator": "cases", "year_week": "2020-10", "weekly_count": 200},
+        {"country_code": "DEU", "indicator": "deaths", "year_week": "2021-01", "weekly_count": 10},
+        {"country_code": "USA", "indicator": "cases", "year_week": "2020-10", "weekly_count": 999},
+        {"country_code": "DEU", "indicator": "cases", "year_week": "2020-11", "weekly_count": 300},
+    ]
     requests_mock.get(download_ecdc.ECDC_COVID_URL, json=mock_data, status_code=200)
 
     # Patch boto3 client to use moto
@@ -51,17 +64,16 @@ def test_save_to_s3_and_lambda_handler(aws_env, s3_client_mock, requests_mock):
     download_ecdc.S3_BUCKET = "test-bucket"
     download_ecdc.S3_PREFIX = "bronze/ecdc/"
 
-
     response = download_ecdc.lambda_handler({}, Context())
 
     # Validate Lambda response
     body = json.loads(response["body"])
     assert response["statusCode"] == 200
-    assert "s3_key" in body
-
-    # Check file exists in S3
-    s3_key = body["s3_key"]
-    obj = s3_client_mock.get_object(Bucket="test-bucket", Key=s3_key)
-    stored_data = json.loads(obj["Body"].read().decode("utf-8"))
-
-    assert stored_data == mock_data
+    assert body["records"] == 3
+    assert sorted(body["stored_files"]) == ["DEU/2020", "DEU/2021"]
+    assert body["stored_files"]["DEU/2020"] == "bronze/ecdc/national/country=DEU/year=2020/ecdc_national.json.gz"
+
+    # Check partition content in S3 (JSON lines)
+    obj = s3_client_mock.get_object(Bucket="test-bucket", Key=body["stored_files"]["DEU/2020"])
+    lines = gzip.decompress(obj["Body"].read()).decode("utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == [mock_data[0], mock_data[3]]
@@ -1,4 +1,5 @@
 import os
+import gzip
 import json
 import boto3
 import pytest
@@ -62,5 +63,5 @@ def test_lambda_handler_fetches_all(aws_env, s3_client_mock, requests_mock):
     # Verify that files are in S3
     for dataset_code, key in body["stored_files"].items():
         obj = s3_client_mock.get_object(Bucket="test-bucket", Key=key)
-        stored_data = json.loads(obj["Body"].read().decode("utf-8"))
+        stored_data = json.loads(gzip.decompress(obj["Body"].read()).decode("utf-8"))
         assert stored_data["dataset"] == dataset_code
@@ -4,6 +4,8 @@ import boto3
 import pytest
 from moto import mock_aws
 from ingestion import download_openaq
+from ingestion import s3_utils
+from ingestion.s3_utils import get_json, get_json_lines
 
 
 @pytest.fixture(scope="function")
@@ -64,4 +66,170 @@ def test_lambda_handler_flow(aws_env, s3_client_mock, monkeypatch):
     # Verify that at least one object was stored in S3
     objects = s3_client_mock.list_objects_v2(Bucket="test-bucket")
     assert "Contents" in objects
-    assert len(objects["Contents"]) > 0
\ No newline at end of file
+    assert len(objects["Contents"]) > 0
+
+    # The chosen sensor is recorded (with its location) for the hourly latest mode
+    # Every bronze write, including the city manifest, is recorded in the ledger
+    segments = s3_client_mock.list_objects_v2(Bucket="test-bucket", Prefix="ledger/segments/")["Contents"]
+    entries = [e for seg in segments for e in get_json_lines(s3_client_mock, "test-bucket", seg["Key"])]
+    bronze = [o["Key"] for o in objects["Contents"] if o["Key"].startswith("bronze/openaq/") and "/_state/" not in o["Key"]]
+    assert sorted(e["key"] for e in entries) == sorted(bronze)
+    assert any("_manifest_" in e["key"] for e in entries)
+
+    selected = get_json(s3_client_mock, "test-bucket", "bronze/openaq/_state/selected_sensors.json.gz")
+    assert selected["sensors"]["DE:Berlin:pm25"]["location_id"] == 1
+
+def test_rollup_failure_does_not_fail_city(aws_env, s3_client_mock, monkeypatch):
+    """A failing rollup update is logged; the city's bronze pages and manifest are still stored."""
+    def fake_request(url, params=None, **kwargs):
+        if url.endswith("/locations"):
+            return {"results": [{"id": 1, "locality": "Berlin"}], "meta": {"found": 1, "limit": 1000}}
+        if "/locations/1/sensors" in url:
+            return {"results": [{"id": 10, "parameter": {"id": 2}}]}
+        if "/sensors/10/measurements/hourly" in url:
+            return {"results": [{"value": 5.0, "period": {"datetimeFrom": {"utc": "2024-01-01T00:00:00Z"}},
+                                 "coverage": {"observedCount": 100}}],
+                    "meta": {"found": 1, "limit": 1000}}
+        return {"results": [], "meta": {"found": 0, "limit": 1000}}
+
+    def failing_rollups(*args, **kwargs):
+        raise RuntimeError("rollup bucket unavailable")
+
+    monkeypatch.setattr(download_openaq, "_request", fake_request)
+    monkeypatch.setattr(download_openaq, "update_sensor_rollups", failing_rollups)
+    monkeypatch.setattr(download_openaq, "EU27_COUNTRIES", ["DE"])
+    monkeypatch.setattr(download_openaq, "TOP_CITIES_BY_COUNTRY", {"DE": ["Berlin"]})
+    download_openaq.s3 = s3_client_mock
+    download_openaq.S3_BUCKET = "test-bucket"
+    download_openaq.S3_PREFIX = "bronze/openaq/"
+    download_openaq.API_KEY = "fake-api-key"
+
+    class Context:
+        aws_request_id = "abcd"
+
+    body = json.loads(download_openaq.lambda_handler({}, Context())["body"])
+
+    assert not any(str(v).startswith("ERROR") for v in body["stored_files"].values())
+    assert body["summary"][0]["chosen"]["pm25"]["sensor_id"] == 10
+
+
+def test_nearest_city_uses_grid_index():
+    """Stations are assigned to the closest city centroid within the radius."""
+    grid = download_openaq.CITY_GRID
+    # Berlin-Spandau (suburb, ~15 km from centre)
+    assert download_openaq.nearest_city(grid, 52.5360, 13.2000) == "Berlin"
+    # Between Vienna and Bratislava, closer to Bratislava
+    assert download_openaq.nearest_city(grid, 48.1400, 17.0500) == "Bratislava"
+    # Countryside far from any configured city
+    assert download_openaq.nearest_city(grid, 51.0, 10.0) is None
+
+
+def test_list_locations_for_city_queries_by_coordinates(monkeypatch):
+    """Discovery sends one radius query and keeps locations assigned to the city."""
+    calls = []
+
+    def fake_request(url, params=None, **kwargs):
+        calls.append(params)
+        return {"results": [
+            {"id": 1, "locality": "Spandau", "country": {"code": "DE"},
+             "coordinates": {"latitude": 52.5360, "longitude": 13.2000}},
+            {"id": 2, "locality": "Słubice", "country": {"code": "PL"},
+             "coordinates": {"latitude": 52.3500, "longitude": 14.5600}},
+            {"id": 3, "locality": "Berlin", "country": {"code": "DE"}},
+        ], "meta": {"found": 3, "limit": 1000}}
+
+    monkeypatch.setattr(download_openaq, "_request", fake_request)
+
+    locs = download_openaq.list_locations_for_city("DE", "Berlin")
+
+    assert [loc["id"] for loc in locs] == [1, 3]
+    assert len(calls) == 1
+    assert calls[0]["coordinates"] == "52.52,13.405"
+    assert calls[0]["radius"] == download_openaq.CITY_RADIUS_M
+    assert calls[0]["parameters_id"] == [2, 7] and calls[0]["monitor"] == "true"
+    assert "iso" not in calls[0]
+
+
+def test_sensors_taken_from_location_results(monkeypatch):
+    """Sensors embedded in /locations results need no per-location sensors call."""
+    calls = []
+
+    def fake_request(url, params=None, **kwargs):
+        calls.append(url)
+        return {"results": [{"id": 30, "parameter": {"id": 7}}]}
+
+    monkeypatch.setattr(download_openaq, "_request", fake_request)
+    locs = [
+        {"id": 1, "sensors": [{"id": 10, "parameter": {"id": 2}}, {"id": 11, "parameter": {"id": 7}}]},
+        {"id": 2},
+    ]
+
+    sensors = download_openaq.sensors_for_locations(locs)
+
+    assert [(s["id"], s["location_id"]) for s in sensors] == [(10, 1), (11, 1), (30, 2)]
+    assert calls == [f"{download_openaq.OPENAQ_API_URL}/locations/2/sensors"]
+
+
+def test_latest_mode_batches_sensors_per_location(aws_env, s3_client_mock, monkeypatch):
+    """Latest mode makes one call per location and appends selected sensors to the hot partition."""
+    calls = []
+
+    def fake_request(url, params=None, **kwargs):
+        calls.append(url)
+        if url.endswith("/locations/1/latest"):
+            return {"results": [
+                {"sensorsId": 10, "value": 12.5, "datetime": {"utc": "2025-01-01T10:00:00Z"}},
+                {"sensorsId": 11, "value": 30.0, "datetime": {"utc": "2025-01-01T10:00:00Z"}},
+                {"sensorsId": 99, "value": 1.0, "datetime": {"utc": "2025-01-01T10:00:00Z"}},
+            ]}
+        return {"results": []}
+
+    monkeypatch.setattr(download_openaq, "_request", fake_request)
+    download_openaq.s3 = s3_client_mock
+    download_openaq.S3_BUCKET = "test-bucket"
+    download_openaq.API_KEY = "fake-api-key"
+    download_openaq.save_selected_sensors([
+        {"iso": "DE", "city": "Berlin", "chosen": {
+            "pm25": {"sensor_id": 10, "observed_hours": 100, "location_id": 1},
+            "no2": {"sensor_id": 11, "observed_hours": 90, "location_id": 1},
+        }},
+    ])
+
+    class Context:
+        aws_request_id = "hot1"
+
+    response = download_openaq.lambda_handler({"mode": "latest"}, Context())
+    body = json.loads(response["body"])
+
+    assert response["statusCode"] == 200
+    assert body["api_calls"] == 1 and body["readings"] == 2
+    assert calls == [f"{download_openaq.OPENAQ_API_URL}/locations/1/latest"]
+    assert body["s3_key"].startswith("bronze/openaq/latest/date=")
+    assert body["s3_key"].endswith("latest_hot1.json.gz")
+
+    rows = get_json_lines(s3_client_mock, "test-bucket", body["s3_key"])
+    assert {(r["parameter"], r["sensor_id"], r["value"]) for r in rows} == {("pm25", 10, 12.5), ("no2", 11, 30.0)}
+
+
+def test_handler_discards_ledger_entries_of_failed_invocation(aws_env, s3_client_mock, monkeypatch):
+    """Entries queued by an earlier failed invocation are not flushed under the next request ID."""
+    def failing_request(url, params=None, **kwargs):
+        raise RuntimeError("OpenAQ unavailable")
+
+    monkeypatch.setattr(download_openaq, "_request", failing_request)
+    download_openaq.s3 = s3_client_mock
+    download_openaq.S3_BUCKET = "test-bucket"
+    download_openaq.API_KEY = "fake-api-key"
+    download_openaq.save_selected_sensors([
+        {"iso": "DE", "city": "Berlin", "chosen": {"pm25": {"sensor_id": 10, "location_id": 1}}},
+    ])
+    s3_utils.pending_ledger_entries.append({"key": "bronze/openaq/stale.json.gz", "source": "openaq"})
+
+    class Context:
+        aws_request_id = "next"
+
+    with pytest.raises(RuntimeError):
+        download_openaq.lambda_handler({"mode": "latest"}, Context())
+
+    assert s3_utils.pending_ledger_entries == []
+    assert "Contents" not in s3_client_mock.list_objects_v2(Bucket="test-bucket", Prefix="ledger/segments/")
@@ -1,4 +1,5 @@
 import os
+import gzip
 import json
 import boto3
 import pytest
@@ -76,6 +77,14 @@ def test_lambda_handler_fetches_all(aws_env, s3_client_mock, requests_mock):
     # Verify that each indicator was stored in S3
     for indicator_code, key in body["stored_files"].items():
         obj = s3_client_mock.get_object(Bucket="test-bucket", Key=key)
-        stored_data = json.loads(obj["Body"].read().decode("utf-8"))
+        stored_data = json.loads(gzip.decompress(obj["Body"].read()).decode("utf-8"))
         assert stored_data["indicator"] == indicator_code
         assert "records" in stored_data
+
+    # Verify that the run was recorded in the ingestion ledger
+    segments = s3_client_mock.list_objects_v2(Bucket="test-bucket", Prefix="ledger/segments/")["Contents"]
+    assert len(segments) == 1
+    obj = s3_client_mock.get_object(Bucket="test-bucket", Key=segments[0]["Key"])
+    entries = [json.loads(line) for line in gzip.decompress(obj["Body"].read()).decode("utf-8").splitlines()]
+    assert {e["key"] for e in entries} == set(body["stored_files"].values())
+    assert all(e["source"] == "who" and e["key"] == body["stored_files"][e["dataset"]] for e in entries)
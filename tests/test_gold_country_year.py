@@ -0,0 +1,208 @@
+import json
+import boto3
+import pytest
+from moto import mock_aws
+from ingestion import gold_country_year, rollup_openaq, s3_utils
+
+
+@pytest.fixture(scope="function")
+def s3_client_mock():
+    """Mocked S3 client using moto."""
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="eu-central-1")
+        s3.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-central-1"},
+        )
+        yield s3
+
+
+WHO_DATA = {"indicator": "AIR_42", "records": [
+    {"SpatialDim": "POL", "TimeDim": 2019, "Dim1Type": "SEX", "Dim1": "SEX_MLE", "NumericValue": 90.0},
+    {"SpatialDim": "POL", "TimeDim": 2019, "Dim1Type": "SEX", "Dim1": "SEX_BTSX", "NumericValue": 80.0},
+    {"SpatialDim": "DEU", "TimeDim": 2019, "Dim1Type": "SEX", "Dim1": "SEX_BTSX", "NumericValue": 20.0},
+]}
+
+# JSON-stat shape of nama_10_pc: freq (1) x unit (2) x na_item (2) x geo (2) x time (2)
+EUROSTAT_DATA = {
+    "id": ["freq", "unit", "na_item", "geo", "time"],
+    "size": [1, 2, 2, 2, 2],
+    "value": [float(i + 1) for i in range(16)],
+    "dimension": {
+        "freq": {"category": {"index": {"A": 0}}},
+        "unit": {"category": {"index": {"CP_EUR_HAB": 0, "CP_PPS_EU27_2020_HAB": 1}}},
+        "na_item": {"category": {"index": {"B1GQ": 0, "B1G": 1}}},
+        "geo": {"category": {"index": {"PL": 0, "EL": 1}}},
+        "time": {"category": {"index": {"2019": 0, "2020": 1}}},
+    },
+}
+
+ECDC_DATA = [
+    {"country_code": "POL", "indicator": "cases", "year_week": "2020-10", "weekly_count": 5},
+    {"country_code": "POL", "indicator": "cases", "year_week": "2020-11", "weekly_count": 7},
+    {"country_code": "USA", "indicator": "cases", "year_week": "2020-11", "weekly_count": 999},
+]
+
+
+def put_ecdc(s3, country, year, rows):
+    key = f"bronze/ecdc/national/country={country}/year={year}/ecdc_national.json"
+    s3_utils.put_json_lines(s3, "test-bucket", key, rows)
+
+
+def select_sensors(s3, *sensors):
+    """Write the OpenAQ sensor selection: (iso, city, parameter, sensor_id) tuples."""
+    s3_utils.put_json(s3, "test-bucket", gold_country_year.OPENAQ_SELECTION_KEY, {"sensors": {
+        f"{iso}:{city}:{param}": {"iso": iso, "city": city, "parameter": param, "sensor_id": sid}
+        for iso, city, param, sid in sensors
+    }}, codec=s3_utils.INTERNAL_COMPRESSION)
+
+
+def seed_inputs(s3):
+    s3_utils.put_json(s3, "test-bucket", "bronze/who/AIR_42_req1.json", WHO_DATA)
+    s3_utils.put_json(s3, "test-bucket", "bronze/eurostat/nama_10_pc_req1.json", EUROSTAT_DATA)
+    put_ecdc(s3, "POL", "2020", ECDC_DATA[:2])
+    rollup_openaq.update_sensor_rollups(s3, "test-bucket", "PL", "warsaw", "pm25", 7, {
+        "2019-05-01T00": 10.0, "2019-05-01T01": 30.0, "2019-06-01T00": 20.0,
+    })
+    select_sensors(s3, ("PL", "Warsaw", "pm25", 7))
+
+
+def read_year(s3, year):
+    key = s3_utils.stored_key(f"{gold_country_year.COUNTRY_YEAR_PREFIX}year={year}/country_year.json", s3_utils.INTERNAL_COMPRESSION)
+    return {r["iso2"]: r for r in s3_utils.get_json_lines(s3, "test-bucket", key)}
+
+
+def test_extractors_map_codes_to_iso2():
+    """WHO ISO3, Eurostat geo and ECDC ISO3 codes resolve to ISO2 country-year cells."""
+    assert gold_country_year.extract_who(WHO_DATA)["PL|2019"] == {"who_air_42": 80.0}
+    eurostat = gold_country_year.extract_eurostat(EUROSTAT_DATA, "nama_10_pc")
+    # unit=CP_PPS_EU27_2020_HAB, na_item=B1GQ (flat positions 8-11), not the first category
+    assert eurostat == {"PL|2019": {"eurostat_nama_10_pc": 9.0}, "PL|2020": {"eurostat_nama_10_pc": 10.0},
+                        "GR|2019": {"eurostat_nama_10_pc": 11.0}, "GR|2020": {"eurostat_nama_10_pc": 12.0}}
+    assert gold_country_year.extract_ecdc(ECDC_DATA) == {"PL|2020": {"ecdc_cases": 12}}
+
+
+def test_extract_who_warns_when_slice_matches_nothing(capsys):
+    """A configured indicator whose records carry an unlisted dimension is skipped with a warning."""
+    data = {"indicator": "AIR_35", "records": [
+        {"SpatialDim": "POL", "TimeDim": 2019, "Dim1Type": "SEX", "Dim1": "SEX_BTSX",
+         "Dim2Type": "ENVCAUSE", "Dim2": "ENVCAUSE_TOTAL", "NumericValue": 5.0},
+    ]}
+    assert gold_country_year.extract_who(data) == {}
+    assert "WARN: WHO indicator AIR_35 has no records matching" in capsys.readouterr().out
+
+
+def test_extractors_skip_unconfigured_slices():
+    """Datasets, dimensions and indicators without a configured headline slice yield no features."""
+    # env_air_emis: airpol (2) x src_nfr (2) x unit (1) x geo (1) x time (1)
+    emissions = {
+        "id": ["airpol", "src_nfr", "unit", "geo", "time"],
+        "size": [2, 2, 1, 1, 1],
+        "value": {"0": 500.0, "1": 80.0, "2": 700.0, "3": 90.0},
+        "dimension": {
+            "airpol": {"category": {"index": {"NOX": 0, "PM2_5": 1}}},
+            "src_nfr": {"category": {"index": {"NFR_TOT_NAT": 0, "NFR1A1": 1}}},
+            "unit": {"category": {"index": {"T": 0}}},
+            "geo": {"category": {"index": {"PL": 0}}},
+            "time": {"category": {"index": {"2019": 0}}},
+        },
+    }
+    assert gold_country_year.extract_eurostat(emissions, "env_air_emis") == {
+        "PL|2019": {"eurostat_env_air_emis": 700.0}}
+    assert gold_country_year.extract_eurostat(emissions, "not_configured") == {}
+
+    with_sector = {**emissions, "id": ["airpol", "src_nfr", "unit", "sector", "geo", "time"],
+                   "size": [2, 2, 1, 2, 1, 1],
+                   "dimension": {**emissions["dimension"],
+                                 "sector": {"category": {"index": {"A": 0, "B": 1}}}}}
+    assert gold_country_year.extract_eurostat(with_sector, "env_air_emis") == {}
+
+    # MORT_500 (sex x age group x cause) has no configured slice
+    mort = {"indicator": "MORT_500", "records": [
+        {"SpatialDim": "POL", "TimeDim": 2019, "Dim1Type": "SEX", "Dim1": "SEX_BTSX",
+         "Dim2Type": "AGEGROUP", "Dim2": "AGEGROUP_YEARS0-4", "Dim3Type": "GHECAUSES", "Dim3": "GHE110",
+         "NumericValue": 12.0},
+    ]}
+    assert gold_country_year.extract_who(mort) == {}
+
+    # records broken down by a dimension outside the slice are ignored
+    by_age = {"indicator": "AIR_42", "records": WHO_DATA["records"] + [
+        {"SpatialDim": "POL", "TimeDim": 2020, "Dim1Type": "SEX", "Dim1": "SEX_BTSX",
+         "Dim2Type": "AGEGROUP", "Dim2": "AGEGROUP_YEARS0-4", "NumericValue": 1.0},
+    ]}
+    assert "PL|2020" not in gold_country_year.extract_who(by_age)
+
+
+def test_build_joins_sources_side_by_side(s3_client_mock):
+    """A country-year row holds WHO, Eurostat, ECDC and OpenAQ features together."""
+    seed_inputs(s3_client_mock)
+
+    summary = gold_country_year.build_country_year(s3_client_mock, "test-bucket")
+
+    assert summary["years_written"] == ["2019", "2020"]
+    pl = read_year(s3_client_mock, 2019)["PL"]
+    assert pl["iso3"] == "POL" and pl["eurostat_geo"] == "PL"
+    assert pl["who_air_42"] == 80.0
+    assert pl["eurostat_nama_10_pc"] == 9.0
+    assert pl["openaq_pm25_mean"] == pytest.approx(20.0)
+    assert pl["openaq_pm25_coverage_hours"] == 3
+    assert read_year(s3_client_mock, 2020)["PL"]["ecdc_cases"] == 12
+    assert read_year(s3_client_mock, 2019)["DE"]["who_air_42"] == 20.0
+
+
+def test_rebuild_only_changed_country_years(s3_client_mock):
+    """Unchanged inputs are not re-read; a changed input rewrites only affected years."""
+    seed_inputs(s3_client_mock)
+    gold_country_year.build_country_year(s3_client_mock, "test-bucket")
+
+    noop = gold_country_year.build_country_year(s3_client_mock, "test-bucket")
+    assert noop == {"slots_read": [], "country_years_rebuilt": 0, "years_written": []}
+
+    put_ecdc(s3_client_mock, "DEU", "2020", [
+        {"country_code": "DEU", "indicator": "deaths", "year_week": "2020-01", "weekly_count": 3},
+    ])
+    summary = gold_country_year.build_country_year(s3_client_mock, "test-bucket")
+
+    assert summary == {"slots_read": ["ecdc:DEU/2020"], "country_years_rebuilt": 1, "years_written": ["2020"]}
+    year_2020 = read_year(s3_client_mock, 2020)
+    assert year_2020["DE"]["ecdc_deaths"] == 3
+    assert year_2020["PL"]["ecdc_cases"] == 12
+
+
+def test_lambda_handler(s3_client_mock):
+    """Handler returns the build summary."""
+    seed_inputs(s3_client_mock)
+    gold_country_year.s3_client = s3_client_mock
+    gold_country_year.S3_BUCKET = "test-bucket"
+
+    response = gold_country_year.lambda_handler({"full_rebuild": True}, None)
+
+    body = json.loads(response["body"])
+    assert response["statusCode"] == 200
+    assert sorted(body["slots_read"]) == ["ecdc:POL/2020", "eurostat:nama_10_pc", "openaq:PL/warsaw/pm25/sensor=7", "who:AIR_42"]
+
+
+def test_openaq_features_use_selected_sensors_per_city(s3_client_mock):
+    """Only selected sensors count; cities are averaged, not summed; a re-pick rebuilds the rows."""
+    rollups = {
+        ("warsaw", 7): {"2019-05-01T00": 10.0, "2019-05-01T01": 30.0},
+        ("warsaw", 8): {"2019-05-01T00": 100.0},  # sensor picked by an earlier run
+        ("krakow", 9): {"2019-05-01T00": 40.0, "2019-05-01T01": 40.0, "2019-05-01T02": 40.0, "2019-05-01T03": 40.0},
+    }
+    for (city, sid), hours in rollups.items():
+        rollup_openaq.update_sensor_rollups(s3_client_mock, "test-bucket", "PL", city, "pm25", sid, hours)
+    select_sensors(s3_client_mock, ("PL", "Warsaw", "pm25", 7), ("PL", "Krakow", "pm25", 9))
+
+    gold_country_year.build_country_year(s3_client_mock, "test-bucket")
+    pl = read_year(s3_client_mock, 2019)["PL"]
+    assert pl["openaq_pm25_mean"] == pytest.approx((20.0 + 40.0) / 2)
+    assert pl["openaq_pm25_max"] == 40.0
+    assert pl["openaq_pm25_coverage_hours"] == pytest.approx(3.0)
+    assert pl["openaq_pm25_cities"] == 2
+
+    select_sensors(s3_client_mock, ("PL", "Warsaw", "pm25", 8), ("PL", "Krakow", "pm25", 9))
+    summary = gold_country_year.build_country_year(s3_client_mock, "test-bucket")
+    assert summary["years_written"] == ["2019"]
+    pl = read_year(s3_client_mock, 2019)["PL"]
+    assert pl["openaq_pm25_mean"] == pytest.approx((100.0 + 40.0) / 2)
+    assert pl["openaq_pm25_max"] == 100.0
@@ -0,0 +1,43 @@
+import os
+import re
+import zipfile
+import importlib.util
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+spec = importlib.util.spec_from_file_location(
+    "build_lambdas", os.path.join(ROOT, "lambda_build", "build_lambdas.py"))
+build_lambdas = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(build_lambdas)
+
+# Flat-package fallback imports: "from s3_utils import ..." (no ingestion. prefix)
+FLAT_IMPORT_RE = re.compile(r"^\s+from (\w+) import", re.MULTILINE)
+
+
+def local_imports(module: str) -> set:
+    """Helper modules a module imports (transitively) from the ingestion directory."""
+    seen, todo = set(), [module]
+    while todo:
+        with open(os.path.join(build_lambdas.INGESTION_DIR, todo.pop()), encoding="utf-8") as fh:
+            for name in FLAT_IMPORT_RE.findall(fh.read()):
+                path = f"{name}.py"
+                if path not in seen and os.path.exists(os.path.join(build_lambdas.INGESTION_DIR, path)):
+                    seen.add(path)
+                    todo.append(path)
+    return seen
+
+
+@pytest.mark.parametrize("name", sorted(build_lambdas.BUNDLES))
+def test_bundle_ships_current_handler_and_helpers(name):
+    """Each committed bundle holds the handler and every helper it imports, identical to ingestion/."""
+    handler = build_lambdas.BUNDLES[name]
+    needed = {handler} | local_imports(handler)
+    assert needed <= {handler, *build_lambdas.SHARED_MODULES}
+
+    with zipfile.ZipFile(os.path.join(build_lambdas.BUILD_DIR, name, f"{name}.zip")) as zf:
+        for module in needed:
+            with open(os.path.join(build_lambdas.INGESTION_DIR, module), "rb") as fh:
+                assert zf.read(module) == fh.read(), f"{name}.zip has a stale {module}; run build_lambdas.py"
+        # BRONZE_COMPRESSION=zstd must work in every deployed bundle
+        assert any(n.startswith("zstandard/") for n in zf.namelist())
@@ -0,0 +1,104 @@
+import json
+import boto3
+import pytest
+from moto import mock_aws
+from ingestion import ledger, rollup_openaq, s3_utils
+
+
+@pytest.fixture(scope="function")
+def s3_client_mock(monkeypatch):
+    """Mocked S3 client using moto (segments are readable as soon as they are written)."""
+    monkeypatch.setattr(ledger, "SETTLE_SECONDS", 0)
+    s3_utils.pending_ledger_entries.clear()
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="eu-central-1")
+        s3.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-central-1"},
+        )
+        yield s3
+
+
+def write(s3, key, obj, source="who", dataset="AIR_10"):
+    return s3_utils.put_json(s3, "test-bucket", key, obj, ledger={
+        "source": source, "dataset": dataset, "rows": 1, "time_from": "2020", "time_to": "2021",
+    })
+
+
+def test_flush_writes_segment_with_size_and_checksum(s3_client_mock):
+    """Ledger-tagged writes are persisted as one segment per run."""
+    key = write(s3_client_mock, "bronze/who/AIR_10_r1.json", {"records": [1]})
+    segment = ledger.flush_ledger(s3_client_mock, "test-bucket", "who", "r1")
+
+    assert segment.startswith(ledger.SEGMENTS_PREFIX)
+    assert s3_utils.pending_ledger_entries == []
+    (entry,) = s3_utils.get_json_lines(s3_client_mock, "test-bucket", segment)
+    head = s3_client_mock.head_object(Bucket="test-bucket", Key=key)
+    assert entry["key"] == key
+    assert entry["bytes"] == head["ContentLength"]
+    assert entry["request_id"] == "r1"
+    assert len(entry["sha256"]) == 64
+    assert ledger.flush_ledger(s3_client_mock, "test-bucket", "who", "r2") is None
+
+
+def test_read_entries_since_cursor_only_returns_new(s3_client_mock):
+    """Consumers resume from a cursor and see only newer segments."""
+    write(s3_client_mock, "bronze/who/a.json", {})
+    ledger.flush_ledger(s3_client_mock, "test-bucket", "who", "r1")
+    entries, cursor = ledger.read_entries_since(s3_client_mock, "test-bucket")
+    assert [e["key"] for e in entries] == ["bronze/who/a.json.gz"]
+
+    write(s3_client_mock, "bronze/eurostat/b.json", {}, source="eurostat", dataset="nama_10_pc")
+    ledger.flush_ledger(s3_client_mock, "test-bucket", "eurostat", "r2")
+    entries, _ = ledger.read_entries_since(s3_client_mock, "test-bucket", cursor)
+    assert [e["source"] for e in entries] == ["eurostat"]
+    assert ledger.read_entries_since(s3_client_mock, "test-bucket", cursor, source="who")[0] == []
+
+
+def test_read_entries_since_holds_back_unsettled_segments(s3_client_mock):
+    """Segments inside the settle lag are not read and the cursor does not pass them."""
+    old = f"{ledger.SEGMENTS_PREFIX}20200101T000000000000Z_who_r0.jsonl"
+    s3_utils.put_json_lines(s3_client_mock, "test-bucket", old, [{"key": "bronze/who/old.json.gz", "source": "who"}])
+    write(s3_client_mock, "bronze/who/new.json", {})
+    ledger.flush_ledger(s3_client_mock, "test-bucket", "who", "r1")
+
+    entries, cursor = ledger.read_entries_since(s3_client_mock, "test-bucket", settle_seconds=300)
+    assert [e["key"] for e in entries] == ["bronze/who/old.json.gz"]
+    assert cursor.startswith(old)
+
+    entries, _ = ledger.read_entries_since(s3_client_mock, "test-bucket", cursor, settle_seconds=0)
+    assert [e["key"] for e in entries] == ["bronze/who/new.json.gz"]
+
+
+def test_compaction_builds_columnar_snapshot(s3_client_mock):
+    """Compaction folds new segments into the snapshot, keeping the latest entry per key."""
+    write(s3_client_mock, "bronze/ecdc/p.json", {"v": 1}, source="ecdc", dataset="national/POL")
+    ledger.flush_ledger(s3_client_mock, "test-bucket", "ecdc", "r1")
+    assert ledger.compact_ledger(s3_client_mock, "test-bucket")["rows"] == 1
+
+    write(s3_client_mock, "bronze/ecdc/p.json", {"v": 2}, source="ecdc", dataset="national/POL")
+    write(s3_client_mock, "bronze/ecdc/q.json", {"v": 3}, source="ecdc", dataset="national/DEU")
+    ledger.flush_ledger(s3_client_mock, "test-bucket", "ecdc", "r2")
+    summary = ledger.compact_ledger(s3_client_mock, "test-bucket")
+
+    assert summary["new_entries"] == 2 and summary["rows"] == 2
+    snapshot = ledger.load_snapshot(s3_client_mock, "test-bucket")
+    assert snapshot["columns"]["key"] == ["bronze/ecdc/p.json.gz", "bronze/ecdc/q.json.gz"]
+    assert snapshot["columns"]["request_id"] == ["r2", "r2"]
+    assert ledger.compact_ledger(s3_client_mock, "test-bucket")["new_entries"] == 0
+
+
+def test_rollup_consumes_openaq_pages_from_ledger(s3_client_mock):
+    """OpenAQ rollups find new pages via the ledger instead of listing bronze."""
+    page = {"results": [{"value": 5.0, "period": {"datetimeFrom": {"utc": "2024-04-01T00:00:00Z"}}}]}
+    write(s3_client_mock, "bronze/openaq/v3/eu27/PL/warsaw/pm25/sensor=3/page=1_r1_ts.json", page,
+          source="openaq", dataset="PL/warsaw/pm25/sensor=3")
+    ledger.flush_ledger(s3_client_mock, "test-bucket", "openaq", "r1")
+    rollup_openaq.s3_client = s3_client_mock
+    rollup_openaq.S3_BUCKET = "test-bucket"
+
+    body = json.loads(rollup_openaq.lambda_handler({}, None)["body"])
+    assert body["updated"] == {"PL/warsaw/pm25/sensor=3": ["2024-04"]}
+
+    body = json.loads(rollup_openaq.lambda_handler({}, None)["body"])
+    assert body["updated"] == {}
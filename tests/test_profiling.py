@@ -0,0 +1,80 @@
+import json
+import marshal
+import boto3
+import pytest
+from moto import mock_aws
+from ingestion import profiling
+
+
+@pytest.fixture(scope="function")
+def s3_client_mock():
+    """Mocked S3 client using moto."""
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="eu-central-1")
+        s3.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-central-1"},
+        )
+        yield s3
+
+
+class Context:
+    aws_request_id = "prof-1"
+
+
+def fake_handler(event, context):
+    data = [{"value": i} for i in range(1000)]
+    profiling.checkpoint()
+    n = len(data)
+    del data
+    return {"statusCode": 200, "body": json.dumps({"n": n})}
+
+
+def test_profiling_off_calls_handler_directly(s3_client_mock, monkeypatch):
+    """Without flag or env var the handler runs unwrapped and nothing is uploaded."""
+    monkeypatch.delenv(profiling.PROFILE_ENV_VAR, raising=False)
+
+    response = profiling.run_with_profiling(fake_handler, {}, Context(), s3_client_mock, "test-bucket", "openaq")
+
+    assert response == fake_handler({}, None)
+    assert "Contents" not in s3_client_mock.list_objects_v2(Bucket="test-bucket")
+
+
+def test_profiling_event_flag_uploads_stats_and_summary(s3_client_mock, monkeypatch):
+    """Event flag enables profiling; stats and summary land under profiles/."""
+    monkeypatch.delenv(profiling.PROFILE_ENV_VAR, raising=False)
+
+    response = profiling.run_with_profiling(
+        fake_handler, {"profile": True}, Context(), s3_client_mock, "test-bucket", "openaq"
+    )
+
+    assert response["statusCode"] == 200
+    keys = response["profile_keys"]
+    assert keys == {"stats": "profiles/openaq/prof-1.prof", "summary": "profiles/openaq/prof-1.txt"}
+
+    stats = marshal.loads(s3_client_mock.get_object(Bucket="test-bucket", Key=keys["stats"])["Body"].read())
+    assert any(func[2] == "fake_handler" for func in stats)
+
+    summary = s3_client_mock.get_object(Bucket="test-bucket", Key=keys["summary"])["Body"].read().decode("utf-8")
+    assert "peak traced memory" in summary
+    assert "high-water checkpoint" in summary
+    assert "top 15 allocators at high-water checkpoint (vs. before handler)" in summary
+    assert "top 15 allocators still live at end of run (vs. before handler)" in summary
+    # the list built by the handler is freed before the end, but visible at the checkpoint
+    high_water = summary.split("at high-water checkpoint")[1].split("still live at end")[0]
+    assert "test_profiling.py" in high_water
+
+
+def test_checkpoint_is_noop_without_profiling():
+    """checkpoint() can be called from handlers when profiling is off."""
+    profiling.checkpoint()
+    assert profiling._high_water is None
+
+
+def test_profiling_enabled_by_env_var(monkeypatch):
+    """PROFILE_HANDLER env var switches profiling on for every event."""
+    monkeypatch.setenv(profiling.PROFILE_ENV_VAR, "1")
+    assert profiling.profiling_enabled({})
+    monkeypatch.setenv(profiling.PROFILE_ENV_VAR, "0")
+    assert not profiling.profiling_enabled({})
+    assert profiling.profiling_enabled({"profile": True})
@@ -0,0 +1,107 @@
+import json
+import boto3
+import pytest
+from moto import mock_aws
+from ingestion import rollup_openaq, s3_utils
+
+
+@pytest.fixture(scope="function")
+def s3_client_mock():
+    """Mocked S3 client using moto."""
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="eu-central-1")
+        s3.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-central-1"},
+        )
+        yield s3
+
+
+def hourly_page(values_by_hour):
+    """Build a minimal OpenAQ /measurements/hourly page."""
+    return {
+        "meta": {"found": len(values_by_hour), "limit": 1000},
+        "results": [
+            {"value": v, "period": {"datetimeFrom": {"utc": f"{h}:00:00Z"}}}
+            for h, v in values_by_hour.items()
+        ],
+    }
+
+
+def read(s3, key):
+    return s3_utils.get_json_lines(s3, "test-bucket", s3_utils.stored_key(key, s3_utils.INTERNAL_COMPRESSION))
+
+
+def test_aggregates_are_mergeable():
+    """Merging per-day aggregates equals aggregating all values at once."""
+    a, b = [1.0, 2.0, 3.0], [10.0, 4.0]
+    merged = rollup_openaq.merge_aggregates([rollup_openaq.aggregate(a), rollup_openaq.aggregate(b)])
+    assert merged == rollup_openaq.aggregate(a + b)
+    assert rollup_openaq.with_stats(merged, 48)["mean"] == pytest.approx(4.0)
+
+
+def test_update_sensor_rollups_daily_and_monthly(s3_client_mock):
+    """Daily and monthly rollups are written for touched months only."""
+    hourly = rollup_openaq.extract_hourly_values(hourly_page({
+        "2024-01-01T00": 10.0, "2024-01-01T01": 20.0, "2024-01-02T05": 30.0, "2024-02-01T00": 5.0,
+    }))
+
+    months = rollup_openaq.update_sensor_rollups(s3_client_mock, "test-bucket", "DE", "berlin", "pm25", 10, hourly)
+    assert months == ["2024-01", "2024-02"]
+
+    prefix = rollup_openaq.ROLLUP_PREFIX
+    daily = read(s3_client_mock, f"{prefix}daily/DE/berlin/pm25/sensor=10/month=2024-01.json")
+    assert [row["date"] for row in daily] == ["2024-01-01", "2024-01-02"]
+    assert daily[0]["count"] == 2 and daily[0]["mean"] == pytest.approx(15.0)
+    assert daily[0]["min"] == 10.0 and daily[0]["max"] == 20.0
+
+    monthly = {row["month"]: row for row in read(s3_client_mock, f"{prefix}monthly/DE/berlin/pm25/sensor=10.json")}
+    assert list(monthly) == ["2024-01", "2024-02"]
+    assert monthly["2024-01"]["count"] == 3
+    assert monthly["2024-01"]["sum"] == pytest.approx(60.0)
+    assert monthly["2024-01"]["expected_hours"] == 31 * 24
+    assert monthly["2024-02"]["max"] == 5.0
+
+
+def test_reingesting_same_hours_is_idempotent(s3_client_mock):
+    """Re-fetched hours do not double count; unchanged months are not rewritten."""
+    hourly = {"2024-01-01T00": 10.0, "2024-01-01T01": 20.0}
+    rollup_openaq.update_sensor_rollups(s3_client_mock, "test-bucket", "DE", "berlin", "pm25", 10, hourly)
+
+    assert rollup_openaq.update_sensor_rollups(
+        s3_client_mock, "test-bucket", "DE", "berlin", "pm25", 10, hourly) == []
+
+    months = rollup_openaq.update_sensor_rollups(
+        s3_client_mock, "test-bucket", "DE", "berlin", "pm25", 10, {"2024-01-01T02": 30.0})
+    assert months == ["2024-01"]
+    monthly = read(s3_client_mock, f"{rollup_openaq.ROLLUP_PREFIX}monthly/DE/berlin/pm25/sensor=10.json")
+    assert [(row["month"], row["count"]) for row in monthly] == [("2024-01", 3)]
+
+
+def test_lambda_handler_rolls_up_bronze_pages(s3_client_mock):
+    """Handler rebuilds rollups from listed bronze page keys."""
+    page_key = s3_utils.put_json(
+        s3_client_mock, "test-bucket",
+        "bronze/openaq/v3/eu27/PL/warsaw/no2/sensor=7/page=1_req_20240101T000000Z.json",
+        hourly_page({"2024-03-01T00": 12.0, "2024-03-01T01": 14.0}),
+    )
+    rollup_openaq.s3_client = s3_client_mock
+    rollup_openaq.S3_BUCKET = "test-bucket"
+
+    response = rollup_openaq.lambda_handler({"keys": [page_key]}, None)
+
+    body = json.loads(response["body"])
+    assert response["statusCode"] == 200
+    assert body["updated"] == {"PL/warsaw/no2/sensor=7": ["2024-03"]}
+
+
+def test_rollup_state_ignores_bronze_codec(s3_client_mock, monkeypatch):
+    """Switching the bronze codec does not change rollup keys (state stays reachable)."""
+    monkeypatch.setattr(s3_utils, "BRONZE_COMPRESSION", "none")
+    hourly = {"2024-03-01T00": 1.0}
+    rollup_openaq.update_sensor_rollups(s3_client_mock, "test-bucket", "DE", "berlin", "pm25", 10, hourly)
+    assert rollup_openaq.update_sensor_rollups(
+        s3_client_mock, "test-bucket", "DE", "berlin", "pm25", 10, hourly) == []
+
+    keys = [o["Key"] for o in s3_client_mock.list_objects_v2(Bucket="test-bucket")["Contents"]]
+    assert keys and all(k.endswith(".json.gz") for k in keys)
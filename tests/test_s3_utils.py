@@ -0,0 +1,66 @@
+import gzip
+import json
+import boto3
+import pytest
+from moto import mock_aws
+from ingestion import s3_utils
+
+
+@pytest.fixture(scope="function")
+def s3_client_mock():
+    """Mocked S3 client using moto."""
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="eu-central-1")
+        s3.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-central-1"},
+        )
+        yield s3
+
+
+def test_put_json_gzip_sets_extension_and_metadata(s3_client_mock):
+    """Default gzip write appends .gz and records codec metadata."""
+    payload = {"records": [{"SpatialDim": "POL", "Value": 1}] * 50}
+    key = s3_utils.put_json(s3_client_mock, "test-bucket", "bronze/who/AIR_10_1.json", payload, codec="gzip")
+
+    assert key == "bronze/who/AIR_10_1.json.gz"
+    obj = s3_client_mock.get_object(Bucket="test-bucket", Key=key)
+    assert obj["ContentEncoding"] == "gzip"
+    assert obj["ContentType"] == "application/json"
+    assert obj["Metadata"]["compression"] == "gzip"
+    raw = gzip.decompress(obj["Body"].read())
+    assert int(obj["Metadata"]["uncompressed-bytes"]) == len(raw)
+    assert json.loads(raw) == payload
+
+
+def test_put_json_none_and_get_json_roundtrip(s3_client_mock):
+    """Uncompressed writes keep the original key and read back via get_json."""
+    payload = {"city": "Kraków", "value": [1, 2, 3]}
+    key = s3_utils.put_json(s3_client_mock, "test-bucket", "bronze/x.json", payload, codec="none")
+
+    assert key == "bronze/x.json"
+    assert s3_utils.get_json(s3_client_mock, "test-bucket", key) == payload
+
+
+def test_zstd_roundtrip():
+    """zstd compresses and decompresses when the optional dependency is present."""
+    pytest.importorskip("zstandard")
+    raw = json.dumps({"value": list(range(1000))}).encode("utf-8")
+    body, ext, encoding, level = s3_utils.compress_bytes(raw, codec="zstd", level=5)
+
+    assert (ext, encoding, level) == (".zst", "zstd", 5)
+    assert len(body) < len(raw)
+    assert s3_utils.decompress_bytes(body, s3_utils.codec_for_key("a.json.zst")) == raw
+
+
+def test_unknown_codec_raises():
+    """Unsupported codecs are rejected."""
+    with pytest.raises(ValueError):
+        s3_utils.compress_bytes(b"{}", codec="brotli")
+
+
+def test_get_json_if_exists_returns_default_for_missing_key(s3_client_mock):
+    """Missing objects return the default instead of raising."""
+    key = s3_utils.stored_key("gold/missing.json", codec="gzip")
+    assert key == "gold/missing.json.gz"
+    assert s3_utils.get_json_if_exists(s3_client_mock, "test-bucket", key, default={}) == {}